@@ -30,6 +30,7 @@ class MerchBotAdminSite(admin.AdminSite):
         from catalog.models import Category, Product
         from orders.models import Order
         from promos.models import PromoCode
+        from promos.services import PromoService
         
         # Time ranges
         now = timezone.now()
@@ -64,7 +65,7 @@ class MerchBotAdminSite(admin.AdminSite):
         
         # Promo codes
         total_promos = PromoCode.objects.count()
-        active_promos = PromoCode.objects.filter(is_active=True).count()
+        active_promos = PromoService.get_active_promos().count()
         promo_usage = Order.objects.exclude(promo__isnull=True).count()
         
         # Recent orders
@@ -0,0 +1,19 @@
+"""
+Money helpers shared by orders and promos.
+
+Amounts are converted to integer minor units (tiyin) for arithmetic, using
+settings.DECIMAL_PLACES as the single source of truth for money precision.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+
+
+def to_cents(amount: Decimal) -> int:
+    """Convert a money amount to integer minor units (tiyin)."""
+    return int(amount.scaleb(settings.DECIMAL_PLACES).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents: int) -> Decimal:
+    """Convert integer minor units back to a Decimal with DECIMAL_PLACES places."""
+    return Decimal(cents).scaleb(-settings.DECIMAL_PLACES)
@@ -82,6 +82,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'merchbot.wsgi.application'
+ASGI_APPLICATION = 'merchbot.asgi.application'
 
 
 # Database
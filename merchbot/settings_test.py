@@ -0,0 +1,17 @@
+"""
+Test settings for MerchBot.
+
+Tests only use the ORM (Telegram calls are mocked), so they always run
+against in-memory SQLite, even where DB_NAME points at PostgreSQL.
+"""
+from .settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+        'TEST': {
+            'NAME': ':memory:',
+        },
+    }
+}
@@ -1,6 +1,9 @@
 """
 Orders DRF serializers.
 """
+from datetime import timezone as dt_timezone
+
+from django.utils import timezone
 from rest_framework import serializers
 from orders.models import Order, OrderItem
 from catalog.models import Product
@@ -29,14 +32,21 @@ class OrderCreateSerializer(serializers.Serializer):
         return value
 
 
+class UTCDateTimeField(serializers.DateTimeField):
+    """Datetime as UTC isoformat ("+00:00" offset), the order API's original format."""
+    
+    def to_representation(self, value):
+        return timezone.localtime(value, dt_timezone.utc).isoformat()
+
+
 class OrderCreateResponseSerializer(serializers.Serializer):
     """Response after order creation."""
-    order_id = serializers.IntegerField()
+    order_id = serializers.IntegerField(source='id')
     status = serializers.CharField()
     subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
     discount_total = serializers.DecimalField(max_digits=12, decimal_places=2)
     total = serializers.DecimalField(max_digits=12, decimal_places=2)
-    created_at = serializers.DateTimeField()
+    created_at = UTCDateTimeField()
 
 
 class PromoSerializer(serializers.Serializer):
@@ -1,16 +1,15 @@
 """
 Orders business logic (order creation, snapshots, calculations).
 """
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal
 from typing import List, Dict, Optional, Tuple
-from collections import defaultdict
 
-from django.db import transaction
-from django.conf import settings
+from django.db import connection, transaction
 
 from catalog.models import Product
 from orders.models import Order, OrderItem
 from promos.services import PromoService
+from merchbot.money import to_cents, from_cents
 from merchbot.exceptions import (
     EmptyCartError,
     ProductNotFoundError,
@@ -18,6 +17,10 @@ from merchbot.exceptions import (
 )
 
 
+# Max rows per INSERT when bulk-creating order items
+ORDER_ITEMS_BATCH_SIZE = 500
+
+
 class OrderService:
     """Service for order creation and management."""
     
@@ -33,9 +36,14 @@ class OrderService:
             List[Dict]: Deduplicated items
         """
         # Group by product_id and sum quantities
-        qty_by_product = defaultdict(int)
+        qty_by_product = {}
         for item in items:
-            qty_by_product[item['product_id']] += item['qty']
+            product_id = item['product_id']
+            qty_by_product[product_id] = qty_by_product.get(product_id, 0) + item['qty']
+        
+        # No duplicates: nothing was merged, so the input can be reused as-is
+        if len(qty_by_product) == len(items):
+            return items
         
         # Convert back to list
         return [
@@ -44,12 +52,15 @@ class OrderService:
         ]
     
     @staticmethod
-    def validate_and_get_products(items: List[Dict]) -> Dict[int, Product]:
+    def validate_and_get_products(items: List[Dict], lock: bool = False) -> Dict[int, Product]:
         """
-        Validate cart items and return products.
+        Validate cart items and return products (single query).
         
         Args:
             items: List of {'product_id': int, 'qty': int}
+            lock: Lock product rows (SELECT ... FOR UPDATE) until the
+                surrounding transaction ends. Must be called inside
+                transaction.atomic().
             
         Returns:
             Dict[int, Product]: Mapping of product_id to Product
@@ -59,15 +70,21 @@ class OrderService:
             ProductNotFoundError: Product not found
             ProductInactiveError: Product is not active
         """
+        # Defensive check; create_order() rejects empty carts up front
         if not items:
             raise EmptyCartError()
         
-        # Get all product IDs
-        product_ids = [item['product_id'] for item in items]
+        # Get all product IDs (sorted so concurrent lockers acquire rows in the same order)
+        product_ids = sorted(item['product_id'] for item in items)
         
-        # Fetch all products in one query
-        products = Product.objects.filter(id__in=product_ids).select_related('category')
-        products_by_id = {p.id: p for p in products}
+        # Fetch all products in one query (no joins: only product fields are used)
+        products = Product.objects.filter(id__in=product_ids)
+        if lock:
+            # NO KEY UPDATE (PostgreSQL) doesn't block OrderItem FK inserts
+            products = products.select_for_update(
+                no_key=connection.features.has_select_for_no_key_update
+            ).order_by('id')
+        products_by_id = products.in_bulk()
         
         # Validate all products exist and are active
         for item in items:
@@ -93,16 +110,13 @@ class OrderService:
         Returns:
             Decimal: Subtotal amount
         """
-        subtotal = Decimal('0.00')
-        
-        for item in items:
-            product = products_by_id[item['product_id']]
-            price_effective = product.price_effective
-            qty = item['qty']
-            line_total = price_effective * qty
-            subtotal += line_total
+        # Sum in integer minor units; convert to Decimal once at the end
+        subtotal_cents = sum(
+            to_cents(products_by_id[item['product_id']].price_effective) * item['qty']
+            for item in items
+        )
         
-        return subtotal.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        return from_cents(subtotal_cents)
     
     @staticmethod
     @transaction.atomic
@@ -134,11 +148,15 @@ class OrderService:
             EmptyCartError, ProductNotFoundError, ProductInactiveError,
             PromoNotFoundError, PromoInactiveError, PromoExpiredError
         """
+        # Reject empty carts before touching the DB
+        if not items:
+            raise EmptyCartError()
+        
         # Step 1: Deduplicate items
         items = OrderService.deduplicate_items(items)
         
-        # Step 2: Validate products and get them
-        products_by_id = OrderService.validate_and_get_products(items)
+        # Step 2: Validate products and lock them until the order is saved
+        products_by_id = OrderService.validate_and_get_products(items, lock=True)
         
         # Step 3: Calculate subtotal
         subtotal = OrderService.calculate_subtotal(items, products_by_id)
@@ -151,7 +169,8 @@ class OrderService:
         if promo_code:
             promo, discount_total, total = PromoService.validate_and_calculate(
                 promo_code,
-                subtotal
+                subtotal,
+                lock=True
             )
         
         # Step 5: Create Order
@@ -169,17 +188,14 @@ class OrderService:
         )
         
         # Step 6: Create OrderItems with snapshots
-        order_items = []
-        for item in items:
+        order_items = [None] * len(items)
+        for index, item in enumerate(items):
             product = products_by_id[item['product_id']]
             price_snapshot = product.price_effective
             qty = item['qty']
-            line_total = (price_snapshot * qty).quantize(
-                Decimal('0.01'),
-                rounding=ROUND_HALF_UP
-            )
+            line_total = from_cents(to_cents(price_snapshot) * qty)
             
-            order_item = OrderItem(
+            order_items[index] = OrderItem(
                 order=order,
                 product=product,
                 name_snapshot=product.name,
@@ -187,9 +203,8 @@ class OrderService:
                 qty=qty,
                 line_total=line_total
             )
-            order_items.append(order_item)
         
-        # Bulk create order items
-        OrderItem.objects.bulk_create(order_items)
+        # Bulk create order items (bounded INSERT size for very large carts)
+        OrderItem.objects.bulk_create(order_items, batch_size=ORDER_ITEMS_BATCH_SIZE)
         
         return order
@@ -0,0 +1,53 @@
+"""
+Integration tests for Orders views.
+"""
+import pytest
+import json
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from django.test import TestCase
+
+from catalog.models import Category, Product
+from orders.models import Order
+
+
+@pytest.mark.django_db
+class TestOrderCreateView(TestCase):
+    """Tests for the order creation endpoint."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Setup test data (once per class; each test rolls back to it)."""
+        category = Category.objects.create(
+            name='Test Category',
+            slug='test-category'
+        )
+        
+        cls.product = Product.objects.create(
+            name='Test Product',
+            slug='test-product',
+            description='Test description',
+            price=Decimal('100.00'),
+            quantity=10,
+            category=category
+        )
+    
+    def test_create_order_response(self):
+        """Test the response body, with created_at as UTC isoformat."""
+        response = self.client.post(
+            '/api/v1/orders/',
+            data=json.dumps({
+                'items': [{'product_id': self.product.id, 'qty': 2}],
+                'full_name': 'Test User',
+                'phone_number': '+998901234567',
+                'payment_method': 'cash'
+            }),
+            content_type='application/json'
+        )
+        
+        assert response.status_code == 201
+        data = response.json()
+        order = Order.objects.get(id=data['order_id'])
+        assert data['total'] == '200.00'
+        assert data['created_at'] == order.created_at.astimezone(dt_timezone.utc).isoformat()
+        assert data['created_at'].endswith('+00:00')
@@ -71,16 +71,8 @@ class OrderViewSet(viewsets.GenericViewSet):
             )
             
             # Return success response
-            response_data = {
-                'order_id': order.id,
-                'status': order.status,
-                'subtotal': str(order.subtotal),
-                'discount_total': str(order.discount_total),
-                'total': str(order.total),
-                'created_at': order.created_at.isoformat()
-            }
-            
-            return Response(response_data, status=status.HTTP_201_CREATED)
+            response_serializer = OrderCreateResponseSerializer(order)
+            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
         
         except (
             EmptyCartError,
@@ -3,9 +3,45 @@ Promos Django Admin configuration.
 """
 from django.contrib import admin
 from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 from django.utils import timezone
 from django.db.models import Count
 from promos.models import PromoCode
+from promos.services import PromoService
+
+
+# Badge markup is built once at import; per-row work is a lookup plus
+# a single format_html() for the dynamic part.
+_DISCOUNT_TMPL = (
+    '<span style="background: {}; color: white; padding: 5px 12px; border-radius: 4px; '
+    'font-weight: bold; font-size: 14px;">-{}%</span>'
+)
+# (min percent, color) - first matching band wins
+_COLOR_BY_BAND = (
+    (30, '#dc3545'),  # Red for high discount
+    (15, '#ffc107'),  # Yellow for medium
+    (0, '#28a745'),   # Green for small
+)
+
+_STATUS_BADGES = {
+    True: mark_safe(
+        '<span style="background-color: #28a745; color: white; padding: 3px 10px; '
+        'border-radius: 3px; font-weight: bold;">✓ Active</span>'
+    ),
+    False: mark_safe(
+        '<span style="background-color: #6c757d; color: white; padding: 3px 10px; '
+        'border-radius: 3px; font-weight: bold;">✗ Inactive</span>'
+    ),
+}
+
+_UNLIMITED_HTML = mark_safe('<span style="color: #007bff; font-weight: bold;">∞ Unlimited</span>')
+_STARTS_TMPL = '<span style="color: #ffc107;">⏰ Starts {}</span>'
+_EXPIRED_TMPL = '<span style="color: #dc3545;">❌ Expired {}</span>'
+_VALID_UNTIL_TMPL = '<span style="color: #28a745;">✓ Valid until {}</span>'
+
+_NOT_USED_HTML = mark_safe('<span style="color: #6c757d;">Not used yet</span>')
+_USED_TMPL = '<span style="color: #28a745; font-weight: bold;">{} times</span>'
+_HOT_TMPL = '<span style="color: #dc3545; font-weight: bold;">🔥 {} times</span>'
 
 
 @admin.register(PromoCode)
@@ -43,64 +79,34 @@ class PromoCodeAdmin(admin.ModelAdmin):
     
     def discount_badge(self, obj):
         """Display discount as colored badge."""
-        if obj.percent >= 30:
-            color = '#dc3545'  # Red for high discount
-        elif obj.percent >= 15:
-            color = '#ffc107'  # Yellow for medium
-        else:
-            color = '#28a745'  # Green for small
-        
-        return format_html(
-            '<span style="background: {}; color: white; padding: 5px 12px; border-radius: 4px; font-weight: bold; font-size: 14px;">-{}%</span>',
-            color, obj.percent
-        )
+        color = next(c for threshold, c in _COLOR_BY_BAND if obj.percent >= threshold)
+        return format_html(_DISCOUNT_TMPL, color, obj.percent)
     discount_badge.short_description = 'Discount'
     
     def status_badge(self, obj):
         """Display active status with badge."""
-        if obj.is_active:
-            return format_html(
-                '<span style="background-color: #28a745; color: white; padding: 3px 10px; border-radius: 3px; font-weight: bold;">✓ Active</span>'
-            )
-        return format_html(
-            '<span style="background-color: #6c757d; color: white; padding: 3px 10px; border-radius: 3px; font-weight: bold;">✗ Inactive</span>'
-        )
+        return _STATUS_BADGES[bool(obj.is_active)]
     status_badge.short_description = 'Status'
     
     def validity_status(self, obj):
         """Display validity status for date-restricted promos."""
         if not obj.has_date_window:
-            return format_html(
-                '<span style="color: #007bff; font-weight: bold;">∞ Unlimited</span>'
-            )
+            return _UNLIMITED_HTML
         
         now = timezone.now()
         if now < obj.active_from:
-            return format_html(
-                '<span style="color: #ffc107;">⏰ Starts {}</span>',
-                obj.active_from.strftime('%d.%m.%Y')
-            )
-        elif now > obj.active_to:
-            return format_html(
-                '<span style="color: #dc3545;">❌ Expired {}</span>',
-                obj.active_to.strftime('%d.%m.%Y')
-            )
-        else:
-            return format_html(
-                '<span style="color: #28a745;">✓ Valid until {}</span>',
-                obj.active_to.strftime('%d.%m.%Y')
-            )
+            return format_html(_STARTS_TMPL, obj.active_from.strftime('%d.%m.%Y'))
+        if now > obj.active_to:
+            return format_html(_EXPIRED_TMPL, obj.active_to.strftime('%d.%m.%Y'))
+        return format_html(_VALID_UNTIL_TMPL, obj.active_to.strftime('%d.%m.%Y'))
     validity_status.short_description = 'Validity'
     
     def usage_count(self, obj):
         """Display how many times promo was used."""
         count = obj.orders.count()
         if count == 0:
-            return format_html('<span style="color: #6c757d;">Not used yet</span>')
-        elif count < 5:
-            return format_html('<span style="color: #28a745; font-weight: bold;">{} times</span>', count)
-        else:
-            return format_html('<span style="color: #dc3545; font-weight: bold;">🔥 {} times</span>', count)
+            return _NOT_USED_HTML
+        return format_html(_USED_TMPL if count < 5 else _HOT_TMPL, count)
     usage_count.short_description = 'Usage'
     
     def usage_stats(self, obj):
@@ -143,12 +149,14 @@ class PromoCodeAdmin(admin.ModelAdmin):
     def activate_promos(self, request, queryset):
         """Bulk activate promo codes."""
         updated = queryset.update(is_active=True)
+        PromoService.clear_cache()  # update() doesn't send post_save
         self.message_user(request, f'✅ {updated} promo code(s) activated.')
     activate_promos.short_description = '✓ Activate selected promos'
     
     def deactivate_promos(self, request, queryset):
         """Bulk deactivate promo codes."""
         updated = queryset.update(is_active=False)
+        PromoService.clear_cache()  # update() doesn't send post_save
         self.message_user(request, f'⚠️ {updated} promo code(s) deactivated.')
     deactivate_promos.short_description = '✗ Deactivate selected promos'
     
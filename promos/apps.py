@@ -5,4 +5,8 @@ class PromosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'promos'
     verbose_name = 'Promo Codes'
+    
+    def ready(self):
+        """Import signals when app is ready."""
+        import promos.signals  # noqa: F401
 
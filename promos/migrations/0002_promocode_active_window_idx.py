@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-15 22:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(fields=['is_active', 'active_from', 'active_to'], name='promo_active_window_idx'),
+        ),
+    ]
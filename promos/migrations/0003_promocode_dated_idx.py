@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-15 22:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promos', '0002_promocode_active_window_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(condition=models.Q(('has_date_window', True)), fields=['active_to'], name='promo_dated_idx'),
+        ),
+    ]
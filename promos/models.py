@@ -4,6 +4,7 @@ Promo models: PromoCode.
 from decimal import Decimal
 
 from django.db import models
+from django.db.models import Q
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
@@ -49,6 +50,19 @@ class PromoCode(models.Model):
         verbose_name = 'Promo Code'
         verbose_name_plural = 'Promo Codes'
         ordering = ['-created_at']
+        indexes = [
+            # Backs the "active right now" filter (PromoService.get_active_promos)
+            models.Index(
+                fields=['is_active', 'active_from', 'active_to'],
+                name='promo_active_window_idx'
+            ),
+            # Date-restricted promos only (expiry sweeps, extend_validity)
+            models.Index(
+                fields=['active_to'],
+                condition=Q(has_date_window=True),
+                name='promo_dated_idx'
+            ),
+        ]
     
     def __str__(self):
         return f'{self.code} (-{self.percent}%)'
@@ -1,24 +1,109 @@
 """
 Promos business logic (validation, discount calculation).
 """
-from decimal import Decimal, ROUND_HALF_UP
-from typing import Tuple, Optional
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import FrozenSet, Tuple, Optional
+from django.db import connection
+from django.db.models import Q, QuerySet
 from django.utils import timezone
 
 from promos.models import PromoCode
+from merchbot.money import to_cents, from_cents
 from merchbot.exceptions import PromoNotFoundError, PromoInactiveError, PromoExpiredError
 
 
+# Process-local LRU of PromoCode rows keyed by upper-cased code.
+# Entries expire after PROMO_CACHE_TTL seconds (other workers' edits) and
+# the whole cache is cleared by promos.signals on save/delete in this process.
+PROMO_CACHE_MAXSIZE = 512
+PROMO_CACHE_TTL = 60
+
+# Columns read by validation, discount calculation and API responses
+PROMO_FIELDS = ('id', 'code', 'percent', 'is_active', 'has_date_window', 'active_from', 'active_to')
+
+# Longest code that can exist (anything longer is rejected without a query)
+PROMO_CODE_MAX_LENGTH = PromoCode._meta.get_field('code').max_length
+
+_promo_cache: 'OrderedDict[str, Tuple[float, PromoCode]]' = OrderedDict()
+_promo_cache_lock = threading.Lock()
+
+# Set of all existing codes, used to reject unknown codes without a query.
+# Refreshed every PROMO_CACHE_TTL seconds and cleared together with _promo_cache.
+_known_codes: Tuple[float, Optional[FrozenSet[str]]] = (0.0, None)
+
+
 class PromoService:
     """Service for promo code validation and discount calculation."""
     
     @staticmethod
-    def validate_promo(code: str) -> PromoCode:
+    def get_cached_promo(key: str) -> Optional[PromoCode]:
+        """
+        Get promo code from the process-local cache.
+        
+        Args:
+            key: Upper-cased promo code
+            
+        Returns:
+            PromoCode | None: Cached promo or None on miss/expiry
+        """
+        with _promo_cache_lock:
+            entry = _promo_cache.get(key)
+            if entry is None:
+                return None
+            
+            expires_at, promo = entry
+            if expires_at < time.monotonic():
+                del _promo_cache[key]
+                return None
+            
+            _promo_cache.move_to_end(key)
+            return promo
+    
+    @staticmethod
+    def cache_promo(key: str, promo: PromoCode) -> None:
+        """Store promo code in the process-local cache (evicting LRU entries)."""
+        with _promo_cache_lock:
+            _promo_cache[key] = (time.monotonic() + PROMO_CACHE_TTL, promo)
+            _promo_cache.move_to_end(key)
+            while len(_promo_cache) > PROMO_CACHE_MAXSIZE:
+                _promo_cache.popitem(last=False)
+    
+    @staticmethod
+    def clear_cache() -> None:
+        """Drop all cached promo codes (called when promo codes change)."""
+        global _known_codes
+        with _promo_cache_lock:
+            _promo_cache.clear()
+            _known_codes = (0.0, None)
+    
+    @staticmethod
+    def get_known_codes() -> FrozenSet[str]:
+        """
+        Get all existing promo codes, reloading them when the snapshot expires.
+        
+        Returns:
+            FrozenSet[str]: Upper-cased promo codes
+        """
+        global _known_codes
+        with _promo_cache_lock:
+            expires_at, codes = _known_codes
+            if codes is None or expires_at < time.monotonic():
+                codes = frozenset(PromoCode.objects.values_list('code', flat=True))
+                _known_codes = (time.monotonic() + PROMO_CACHE_TTL, codes)
+            return codes
+    
+    @staticmethod
+    def validate_promo(code: str, lock: bool = False) -> PromoCode:
         """
         Validate promo code and return it if valid.
         
         Args:
             code: Promo code (case-insensitive)
+            lock: Lock the promo row (SELECT ... FOR UPDATE) until the
+                surrounding transaction ends
             
         Returns:
             PromoCode: Valid promo code object
@@ -28,12 +113,31 @@ class PromoService:
             PromoInactiveError: Promo code is not active
             PromoExpiredError: Promo code has expired
         """
-        # Find promo code (case-insensitive)
-        promo = PromoCode.objects.filter(code__iexact=code).first()
-        
-        if not promo:
+        cache_key = code.upper()
+        if not cache_key or len(cache_key) > PROMO_CODE_MAX_LENGTH:
             raise PromoNotFoundError()
         
+        # Locked reads always go to the DB; plain validation may use the caches
+        promo = None if lock else PromoService.get_cached_promo(cache_key)
+        
+        if promo is None:
+            if not lock and cache_key not in PromoService.get_known_codes():
+                raise PromoNotFoundError()
+            
+            # Codes are stored upper-cased (PromoCode.save), so an exact match on
+            # the normalized input hits the unique index instead of LOWER() scans
+            promos = PromoCode.objects.filter(code=cache_key).only(*PROMO_FIELDS)
+            if lock:
+                promos = promos.select_for_update(
+                    no_key=connection.features.has_select_for_no_key_update
+                )
+            promo = promos.first()
+            
+            if not promo:
+                raise PromoNotFoundError()
+            
+            PromoService.cache_promo(cache_key, promo)
+        
         if not promo.is_active:
             raise PromoInactiveError()
         
@@ -45,6 +149,19 @@ class PromoService:
         
         return promo
     
+    @staticmethod
+    def get_active_promos() -> QuerySet:
+        """
+        Get promo codes that are valid right now, filtered in SQL.
+        
+        Returns:
+            QuerySet: Active promo codes inside their date window (if any)
+        """
+        now = timezone.now()
+        return PromoCode.objects.filter(is_active=True).filter(
+            Q(has_date_window=False) | Q(active_from__lte=now, active_to__gte=now)
+        )
+    
     @staticmethod
     def calculate_discount(subtotal: Decimal, promo: PromoCode) -> Tuple[Decimal, Decimal]:
         """
@@ -57,20 +174,22 @@ class PromoService:
         Returns:
             Tuple[Decimal, Decimal]: (discount_total, total)
         """
-        # Calculate discount with proper rounding
-        discount_total = (subtotal * promo.percent / Decimal('100')).quantize(
-            Decimal('0.01'),
-            rounding=ROUND_HALF_UP
-        )
+        # Integer math in tiyin and basis points; adding half the divisor before
+        # floor division rounds half up (amounts are never negative)
+        subtotal_cents = to_cents(subtotal)
+        percent_bps = int(promo.percent.scaleb(2))
+        discount_cents = (subtotal_cents * percent_bps + 5000) // 10000
         
-        total = subtotal - discount_total
+        discount_total = from_cents(discount_cents)
+        total = from_cents(subtotal_cents - discount_cents)
         
         return discount_total, total
     
     @staticmethod
     def validate_and_calculate(
         code: str,
-        subtotal: Decimal
+        subtotal: Decimal,
+        lock: bool = False
     ) -> Tuple[PromoCode, Decimal, Decimal]:
         """
         Validate promo code and calculate discount in one call.
@@ -78,6 +197,7 @@ class PromoService:
         Args:
             code: Promo code
             subtotal: Subtotal before discount
+            lock: Lock the promo row (see validate_promo)
             
         Returns:
             Tuple[PromoCode, Decimal, Decimal]: (promo, discount_total, total)
@@ -85,6 +205,6 @@ class PromoService:
         Raises:
             PromoNotFoundError, PromoInactiveError, PromoExpiredError
         """
-        promo = PromoService.validate_promo(code)
+        promo = PromoService.validate_promo(code, lock=lock)
         discount_total, total = PromoService.calculate_discount(subtotal, promo)
         return promo, discount_total, total
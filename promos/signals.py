@@ -0,0 +1,17 @@
+"""
+Promos signals.
+
+Keep the PromoService lookup cache in sync with PromoCode changes.
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from promos.models import PromoCode
+from promos.services import PromoService
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_delete, sender=PromoCode)
+def clear_promo_cache(sender, **kwargs):
+    """Invalidate cached promo codes when any promo code changes."""
+    PromoService.clear_cache()
@@ -0,0 +1,3 @@
+"""
+Promos tests.
+"""
@@ -0,0 +1,150 @@
+"""
+Unit tests for Promos services.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+import pytest
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from promos.models import PromoCode
+from promos.services import PromoService
+from merchbot.exceptions import PromoNotFoundError
+
+
+def _reference_discount(subtotal: Decimal, percent: Decimal):
+    """Decimal quantize implementation the integer math must match."""
+    discount_total = (subtotal * percent / Decimal('100')).quantize(
+        Decimal('0.01'),
+        rounding=ROUND_HALF_UP
+    )
+    return discount_total, subtotal - discount_total
+
+
+class TestCalculateDiscount(SimpleTestCase):
+    """Tests for PromoService.calculate_discount."""
+    
+    def test_rounds_half_up(self):
+        """Test half-cent discounts are rounded up."""
+        promo = PromoCode(code='HALF', percent=Decimal('12.50'))
+        
+        discount_total, total = PromoService.calculate_discount(Decimal('0.20'), promo)
+        
+        assert discount_total == Decimal('0.03')
+        assert total == Decimal('0.17')
+    
+    def test_keeps_two_decimal_places(self):
+        """Test results are always rendered with two decimal places."""
+        promo = PromoCode(code='TEN', percent=Decimal('10.00'))
+        
+        discount_total, total = PromoService.calculate_discount(Decimal('1000.00'), promo)
+        
+        assert str(discount_total) == '100.00'
+        assert str(total) == '900.00'
+    
+    def test_matches_decimal_quantize(self):
+        """Test integer math matches Decimal quantize on a randomized grid."""
+        rng = random.Random(20240601)
+        
+        for _ in range(5000):
+            subtotal = Decimal(rng.randint(0, 10 ** 10)).scaleb(-2)
+            percent = Decimal(rng.randint(1, 10000)).scaleb(-2)
+            promo = PromoCode(code='GRID', percent=percent)
+            
+            assert PromoService.calculate_discount(subtotal, promo) == _reference_discount(subtotal, percent), (
+                subtotal, percent
+            )
+
+
+@pytest.mark.django_db
+class TestValidatePromo(TestCase):
+    """Tests for PromoService.validate_promo lookups."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Setup test data (once per class; each test rolls back to it)."""
+        cls.promo = PromoCode.objects.create(code='SALE10', percent=Decimal('10.00'))
+    
+    def setUp(self):
+        """Start each test with an empty promo cache."""
+        PromoService.clear_cache()
+    
+    def tearDown(self):
+        """Don't leak cached promos into other tests."""
+        PromoService.clear_cache()
+    
+    def test_case_insensitive(self):
+        """Test code lookup ignores case."""
+        self.assertEqual(PromoService.validate_promo('sale10').pk, self.promo.pk)
+    
+    def test_rejects_bad_length_without_query(self):
+        """Test empty and over-long codes fail before touching the DB."""
+        for code in ('', 'X' * 51):
+            with self.assertNumQueries(0):
+                with self.assertRaises(PromoNotFoundError):
+                    PromoService.validate_promo(code)
+    
+    def test_unknown_code_uses_known_codes(self):
+        """Test unknown codes are rejected from the known-codes snapshot."""
+        with self.assertRaises(PromoNotFoundError):
+            PromoService.validate_promo('NOPE')
+        
+        with self.assertNumQueries(0):
+            with self.assertRaises(PromoNotFoundError):
+                PromoService.validate_promo('NOPE2')
+    
+    def test_new_code_visible_after_save(self):
+        """Test saving a promo refreshes the known-codes snapshot."""
+        with self.assertRaises(PromoNotFoundError):
+            PromoService.validate_promo('NEW5')
+        
+        PromoCode.objects.create(code='NEW5', percent=Decimal('5.00'))
+        
+        self.assertEqual(PromoService.validate_promo('new5').code, 'NEW5')
+
+
+class TestPromoValidity(SimpleTestCase):
+    """Tests for PromoCode.is_valid_now / get_validation_error."""
+    
+    def test_enabled_window_checks_dates(self):
+        """Test an enabled date window limits validity to its dates."""
+        now = timezone.now()
+        promo = PromoCode(
+            code='OLD',
+            percent=Decimal('10.00'),
+            has_date_window=True,
+            active_from=now - timedelta(days=10),
+            active_to=now - timedelta(days=1)
+        )
+        
+        self.assertFalse(promo.is_valid_now())
+        self.assertEqual(promo.get_validation_error(), 'PROMO_EXPIRED')
+        
+        promo.active_to = now + timedelta(days=1)
+        
+        self.assertTrue(promo.is_valid_now())
+        self.assertIsNone(promo.get_validation_error())
+    
+    def test_paused_window_ignores_dates(self):
+        """Test switching has_date_window off keeps the dates but stops enforcing them."""
+        now = timezone.now()
+        promo = PromoCode(
+            code='PAUSED',
+            percent=Decimal('10.00'),
+            has_date_window=False,
+            active_from=now - timedelta(days=10),
+            active_to=now - timedelta(days=1)
+        )
+        
+        self.assertTrue(promo.is_valid_now())
+        self.assertIsNone(promo.get_validation_error())
+    
+    def test_no_date_window_is_always_valid(self):
+        """Test promos without dates are valid while active."""
+        promo = PromoCode(code='ANY', percent=Decimal('10.00'))
+        
+        self.assertTrue(promo.is_valid_now())
+        promo.is_active = False
+        self.assertEqual(promo.get_validation_error(), 'PROMO_INACTIVE')
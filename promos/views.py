@@ -1,10 +1,13 @@
 """
 Promos API views.
 """
+from decimal import Decimal
+
+import orjson
+from django.http import HttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from decimal import Decimal
 
 from promos.serializers import PromoValidateRequestSerializer
 from promos.services import PromoService
@@ -19,12 +22,29 @@ from merchbot.exceptions import (
 )
 
 
+def _json_default(obj):
+    """Serialize Decimal amounts as strings (orjson has no native Decimal)."""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError
+
+
+def _json_response(data: dict) -> HttpResponse:
+    """Render a 200 JSON body with orjson, bypassing DRF's renderer."""
+    return HttpResponse(
+        orjson.dumps(data, default=_json_default),
+        content_type='application/json'
+    )
+
+
 class PromoValidateView(APIView):
     """
     POST /api/v1/promos/validate
     
     Validate promo code and calculate discount.
     """
+    # Public endpoint: skip session/basic auth lookups on every request
+    authentication_classes = []
     
     def post(self, request):
         """Validate promo code and return discount calculation."""
@@ -45,55 +65,47 @@ class PromoValidateView(APIView):
         items = data['items']
         
         try:
-            # Deduplicate items
+            # Deduplicate items, validate products and calculate subtotal (once)
             items = OrderService.deduplicate_items(items)
-            
-            # Validate products and calculate subtotal
             products_by_id = OrderService.validate_and_get_products(items)
             subtotal = OrderService.calculate_subtotal(items, products_by_id)
-            
+        
+        except (ProductNotFoundError, ProductInactiveError, EmptyCartError) as e:
+            # Product validation error
+            return Response(
+                {
+                    'error_code': e.error_code,
+                    'message': e.message
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
             # Validate promo and calculate discount
             promo, discount_total, total = PromoService.validate_and_calculate(
                 code,
                 subtotal
             )
-            
-            # Success response
-            return Response({
-                'is_valid': True,
-                'promo': {
-                    'code': promo.code,
-                    'percent': str(promo.percent)
-                },
-                'subtotal': str(subtotal),
-                'discount': str(discount_total),
-                'total': str(total)
-            })
         
         except (PromoNotFoundError, PromoInactiveError, PromoExpiredError) as e:
             # Invalid promo - return calculated subtotal without discount
-            try:
-                items = OrderService.deduplicate_items(items)
-                products_by_id = OrderService.validate_and_get_products(items)
-                subtotal = OrderService.calculate_subtotal(items, products_by_id)
-            except:
-                subtotal = Decimal('0.00')
-            
-            return Response({
+            return _json_response({
                 'is_valid': False,
                 'error_code': e.error_code,
                 'message': e.message,
-                'subtotal': str(subtotal),
+                'subtotal': subtotal,
                 'discount': '0.00',
-                'total': str(subtotal)
+                'total': subtotal
             })
         
-        except (ProductNotFoundError, ProductInactiveError, EmptyCartError) as e:
-            # Product validation error
-            return Response(
-                {
-                    'error_code': e.error_code,
-                    'message': e.message
-                },
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        # Success response
+        return _json_response({
+            'is_valid': True,
+            'promo': {
+                'code': promo.code,
+                'percent': promo.percent
+            },
+            'subtotal': subtotal,
+            'discount': discount_total,
+            'total': total
+        })
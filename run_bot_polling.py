@@ -4,7 +4,10 @@ Run Telegram bot with polling for development.
 """
 import asyncio
 import os
+from typing import Optional
+
 import django
+import httpx
 import logging
 
 # Setup Django
@@ -14,7 +17,8 @@ django.setup()
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from telegram_bot.services.telegram import TelegramService
-from telegram_bot.services.webhook import WebhookService
+from telegram_bot.services.webhook import CALLBACK_HANDLERS
+from telegram_bot.services.notification import parse_callback_data
 from asgiref.sync import sync_to_async
 
 # Setup logging
@@ -24,6 +28,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Shared HTTP client for API health checks (keeps connections alive between calls)
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Get the shared HTTP client, creating it on first use."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            timeout=5.0,
+            limits=httpx.Limits(max_keepalive_connections=4, max_connections=8)
+        )
+    return _HTTP_CLIENT
+
+
+async def close_http_client(application=None):
+    """Close the shared HTTP client (Application post_shutdown hook)."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+        _HTTP_CLIENT = None
+
 async def start_command(update: Update, context):
     """Handle /start command."""
     try:
@@ -88,15 +114,11 @@ async def status_command(update: Update, context):
 async def health_command(update: Update, context):
     """Handle /health command."""
     try:
-        import httpx
         from django.conf import settings
         
-        async with httpx.AsyncClient() as client:
-            api_response = await client.get(
-                f'{settings.ADMIN_URL_PREFIX}/health/',
-                timeout=5.0
-            )
-            
+        client = _get_http_client()
+        api_response = await client.get(f'{settings.ADMIN_URL_PREFIX}/health/')
+        
         if api_response.status_code == 200:
             await update.message.reply_text("✅ API is healthy and responding")
         else:
@@ -105,35 +127,33 @@ async def health_command(update: Update, context):
     except Exception as e:
         await update.message.reply_text(f"❌ API health check failed: {e}")
 
+# Test buttons -> reply text
+_CB_TEST_REPLIES = {
+    'test_success': "✅ Test success button clicked!",
+    'test_cancel': "❌ Test cancel button clicked!",
+}
+
+
 async def handle_callback_query(update: Update, context):
     """Handle callback queries from inline buttons."""
     query = update.callback_query
     callback_data = query.data
     logger.info(f'Callback query received: {callback_data}')
     
+    # Acknowledge in the background so the handler doesn't wait on the round-trip
+    # (this might fail for old queries)
+    ack_task = asyncio.create_task(query.answer())
+    
     try:
-        # Try to answer the callback query first (this might fail for old queries)
-        try:
-            await query.answer()
-        except Exception as e:
-            logger.warning(f'Could not answer callback query: {e}')
+        test_reply = _CB_TEST_REPLIES.get(callback_data)
+        if test_reply is not None:
+            await query.edit_message_text(test_reply)
+            return
         
-        if callback_data.startswith('order_success_'):
-            # Handle successful order closure
-            order_id = callback_data.replace('order_success_', '')
-            await WebhookService._handle_order_success(query, order_id)
-            
-        elif callback_data.startswith('order_cancel_'):
-            # Handle order cancellation
-            order_id = callback_data.replace('order_cancel_', '')
-            await WebhookService._handle_order_cancel(query, order_id)
-            
-        elif callback_data == 'test_success':
-            await query.edit_message_text("✅ Test success button clicked!")
-            
-        elif callback_data == 'test_cancel':
-            await query.edit_message_text("❌ Test cancel button clicked!")
-            
+        action, order_id = parse_callback_data(callback_data)
+        handler = CALLBACK_HANDLERS.get(action)
+        if handler is not None:
+            await handler(query, order_id)
         else:
             try:
                 await query.answer("❓ Unknown command")
@@ -146,6 +166,11 @@ async def handle_callback_query(update: Update, context):
             await query.answer("❌ Error processing command")
         except:
             pass
+    finally:
+        try:
+            await ack_task
+        except Exception as e:
+            logger.warning(f'Could not answer callback query: {e}')
 
 def main():
     """Main function to run the bot."""
@@ -156,7 +181,12 @@ def main():
         print(f"✅ Mini App URL: {config.mini_app_url}")
         
         # Create application
-        application = Application.builder().token(config.bot_token).build()
+        application = (
+            Application.builder()
+            .token(config.bot_token)
+            .post_shutdown(close_http_client)
+            .build()
+        )
         
         # Add handlers
         application.add_handler(CommandHandler("start", start_command))
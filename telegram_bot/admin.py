@@ -3,9 +3,68 @@ Telegram Bot admin configuration.
 """
 from django.contrib import admin
 from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 from django.urls import reverse
 
-from telegram_bot.models import BotConfig, GroupNotification
+from telegram_bot.models import BotConfig, GroupNotification, SINGLETON_PK
+
+
+# Static badge markup, built once at import
+_BOT_STATUS_BADGES = {
+    True: mark_safe(
+        '<span style="background: #28a745; color: white; padding: 4px 10px; '
+        'border-radius: 4px; font-weight: bold;">✓ Active</span>'
+    ),
+    False: mark_safe(
+        '<span style="background: #dc3545; color: white; padding: 4px 10px; '
+        'border-radius: 4px; font-weight: bold;">✗ Inactive</span>'
+    ),
+}
+
+_WEBHOOK_BADGES = {
+    True: mark_safe(
+        '<span style="background: #17a2b8; color: white; padding: 3px 8px; '
+        'border-radius: 3px;">✓ Configured</span>'
+    ),
+    False: mark_safe(
+        '<span style="background: #ffc107; color: #000; padding: 3px 8px; '
+        'border-radius: 3px;">⚠ Not Set</span>'
+    ),
+}
+
+_NOTIFICATION_STATUS_BADGES = {
+    GroupNotification.STATUS_SENT: mark_safe(
+        '<span style="background: #28a745; color: white; padding: 3px 10px; '
+        'border-radius: 3px; font-weight: bold;">✓ Sent</span>'
+    ),
+    GroupNotification.STATUS_FAILED: mark_safe(
+        '<span style="background: #dc3545; color: white; padding: 3px 10px; '
+        'border-radius: 3px; font-weight: bold;">✗ Failed</span>'
+    ),
+    GroupNotification.STATUS_PENDING: mark_safe(
+        '<span style="background: #ffc107; color: #000; padding: 3px 10px; '
+        'border-radius: 3px; font-weight: bold;">⏳ Pending</span>'
+    ),
+}
+
+_ORDER_LINK_TMPL = '<a href="{}">Order #{}</a>'
+
+# (prefix, suffix) of the order change URL, resolved once on first use
+# (not at import: the URLconf imports this module)
+_order_url_parts = None
+
+
+def _order_change_url(order_id):
+    """Build the admin change URL for an order without re-walking the resolver."""
+    global _order_url_parts
+    if _order_url_parts is None:
+        _order_url_parts = reverse('admin:orders_order_change', args=[0]).rsplit('/0/', 1)
+    prefix, suffix = _order_url_parts
+    return f'{prefix}/{order_id}/{suffix}'
+
+
+_ERROR_TMPL = '<span style="color: #dc3545; font-size: 0.9em;">{}</span>'
+_ERROR_PREVIEW_LENGTH = 50
 
 
 @admin.register(BotConfig)
@@ -38,29 +97,17 @@ class BotConfigAdmin(admin.ModelAdmin):
     
     def status_badge(self, obj):
         """Display bot status badge."""
-        if obj.is_active:
-            return format_html(
-                '<span style="background: #28a745; color: white; padding: 4px 10px; border-radius: 4px; font-weight: bold;">✓ Active</span>'
-            )
-        return format_html(
-            '<span style="background: #dc3545; color: white; padding: 4px 10px; border-radius: 4px; font-weight: bold;">✗ Inactive</span>'
-        )
+        return _BOT_STATUS_BADGES[bool(obj.is_active)]
     status_badge.short_description = 'Status'
     
     def webhook_status(self, obj):
         """Display webhook status."""
-        if obj.webhook_url:
-            return format_html(
-                '<span style="background: #17a2b8; color: white; padding: 3px 8px; border-radius: 3px;">✓ Configured</span>'
-            )
-        return format_html(
-            '<span style="background: #ffc107; color: #000; padding: 3px 8px; border-radius: 3px;">⚠ Not Set</span>'
-        )
+        return _WEBHOOK_BADGES[bool(obj.webhook_url)]
     webhook_status.short_description = 'Webhook'
     
     def has_add_permission(self, request):
         """Only one config allowed (singleton)."""
-        return not BotConfig.objects.exists()
+        return not BotConfig.objects.filter(pk=SINGLETON_PK).exists()
     
     def has_delete_permission(self, request, obj=None):
         """Don't allow deletion of config."""
@@ -98,38 +145,35 @@ class GroupNotificationAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        """Join the order so order_link/search don't query per row."""
+        return super().get_queryset(request).select_related('order').only(
+            'id', 'order', 'status', 'message_id', 'error_message',
+            'created_at', 'updated_at',
+            'order__id', 'order__full_name', 'order__status'
+        )
+    
     def order_link(self, obj):
         """Display link to order."""
-        url = reverse('admin:orders_order_change', args=[obj.order.id])
-        return format_html(
-            '<a href="{}">Order #{}</a>',
-            url, obj.order.id
-        )
+        order_id = obj.order_id
+        return format_html(_ORDER_LINK_TMPL, _order_change_url(order_id), order_id)
     order_link.short_description = 'Order'
     
     def status_badge(self, obj):
         """Display status badge."""
-        if obj.status == GroupNotification.STATUS_SENT:
-            return format_html(
-                '<span style="background: #28a745; color: white; padding: 3px 10px; border-radius: 3px; font-weight: bold;">✓ Sent</span>'
-            )
-        elif obj.status == GroupNotification.STATUS_FAILED:
-            return format_html(
-                '<span style="background: #dc3545; color: white; padding: 3px 10px; border-radius: 3px; font-weight: bold;">✗ Failed</span>'
-            )
-        return format_html(
-            '<span style="background: #ffc107; color: #000; padding: 3px 10px; border-radius: 3px; font-weight: bold;">⏳ Pending</span>'
+        return _NOTIFICATION_STATUS_BADGES.get(
+            obj.status, _NOTIFICATION_STATUS_BADGES[GroupNotification.STATUS_PENDING]
         )
     status_badge.short_description = 'Status'
     
     def error_display(self, obj):
         """Display error message preview."""
-        if obj.error_message:
-            return format_html(
-                '<span style="color: #dc3545; font-size: 0.9em;">{}</span>',
-                obj.error_message[:50] + '...' if len(obj.error_message) > 50 else obj.error_message
-            )
-        return '-'
+        message = obj.error_message
+        if not message:
+            return '-'
+        if len(message) > _ERROR_PREVIEW_LENGTH:
+            message = message[:_ERROR_PREVIEW_LENGTH] + '...'
+        return format_html(_ERROR_TMPL, message)
     error_display.short_description = 'Error'
     
     def has_add_permission(self, request):
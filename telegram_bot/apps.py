@@ -1,6 +1,8 @@
 """
 Telegram Bot app configuration.
 """
+import atexit
+
 from django.apps import AppConfig
 
 
@@ -12,5 +14,8 @@ class TelegramBotConfig(AppConfig):
     verbose_name = 'Telegram Bot'
     
     def ready(self):
-        """Import signals when app is ready."""
+        """Import signals and register the shutdown hook when app is ready."""
         import telegram_bot.signals  # noqa: F401
+        from telegram_bot import worker
+        
+        atexit.register(worker.close_all)
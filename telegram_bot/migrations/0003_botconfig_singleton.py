@@ -0,0 +1,29 @@
+# Generated by Django 5.0.2 on 2026-10-15 22:31
+
+from django.db import migrations, models
+
+
+def move_config_to_singleton_pk(apps, schema_editor):
+    """Keep the first config (the one the app has been reading) at pk=1."""
+    BotConfig = apps.get_model('telegram_bot', 'BotConfig')
+    first = BotConfig.objects.order_by('pk').first()
+    if first is None:
+        return
+    BotConfig.objects.exclude(pk=first.pk).delete()
+    if first.pk != 1:
+        BotConfig.objects.filter(pk=first.pk).update(id=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_bot', '0002_botconfig_mini_app_url'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_config_to_singleton_pk, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='botconfig',
+            constraint=models.CheckConstraint(check=models.Q(('id', 1)), name='botconfig_singleton'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.2 on 2026-10-15 22:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_alter_orderitem_product'),
+        ('telegram_bot', '0003_botconfig_singleton'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groupnotification',
+            index=models.Index(fields=['-created_at'], name='gn_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupnotification',
+            index=models.Index(fields=['status', '-created_at'], name='gn_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupnotification',
+            index=models.Index(fields=['order', '-created_at'], name='gn_order_created_idx'),
+        ),
+    ]
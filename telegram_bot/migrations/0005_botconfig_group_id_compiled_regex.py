@@ -0,0 +1,20 @@
+# Generated by Django 5.0.2 on 2026-10-15 22:34
+
+import django.core.validators
+import re
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_bot', '0004_groupnotification_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='botconfig',
+            name='notification_group_id',
+            field=models.CharField(help_text='Telegram group ID where notifications will be sent (e.g., -1001234567890)', max_length=50, validators=[django.core.validators.RegexValidator(message='Group ID must be a valid Telegram chat ID', regex=re.compile('^-?\\d+$'))]),
+        ),
+    ]
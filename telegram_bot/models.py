@@ -1,11 +1,22 @@
 """
 Telegram Bot models.
 """
+import re
+
 from django.db import models
+from django.db.models import Q
 from django.core.validators import RegexValidator
+from django.utils import timezone
 from orders.models import Order
 
 
+# Primary key of the single BotConfig row
+SINGLETON_PK = 1
+
+# Telegram chat IDs are integers (groups/supergroups are negative)
+_GROUP_ID_RE = re.compile(r'^-?\d+$')
+
+
 class BotConfig(models.Model):
     """
     Telegram Bot configuration.
@@ -29,7 +40,7 @@ class BotConfig(models.Model):
         max_length=50,
         validators=[
             RegexValidator(
-                regex=r'^-?\d+$',
+                regex=_GROUP_ID_RE,
                 message='Group ID must be a valid Telegram chat ID'
             )
         ],
@@ -53,16 +64,22 @@ class BotConfig(models.Model):
     class Meta:
         verbose_name = 'Bot Configuration'
         verbose_name_plural = 'Bot Configuration'
+        constraints = [
+            models.CheckConstraint(check=Q(id=SINGLETON_PK), name='botconfig_singleton'),
+        ]
     
     def __str__(self):
         return f'Bot Config (Active: {self.is_active})'
     
     def save(self, *args, **kwargs):
         """Ensure only one config exists (singleton pattern)."""
-        if not self.pk and BotConfig.objects.exists():
-            # Update existing config instead of creating new one
-            existing = BotConfig.objects.first()
-            self.pk = existing.pk
+        # The single row always lives at pk=1 (enforced by botconfig_singleton);
+        # saving a new instance updates it instead of inserting a second row
+        self.pk = SINGLETON_PK
+        kwargs['force_insert'] = False
+        if self.created_at is None:
+            # auto_now_add only fires on INSERT, and this save may be an UPDATE
+            self.created_at = timezone.now()
         super().save(*args, **kwargs)
 
 
@@ -115,6 +132,12 @@ class GroupNotification(models.Model):
         verbose_name = 'Group Notification'
         verbose_name_plural = 'Group Notifications'
         ordering = ['-created_at']
+        indexes = [
+            # Back the admin changelist ordering and its status/order filters
+            models.Index(fields=['-created_at'], name='gn_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='gn_status_created_idx'),
+            models.Index(fields=['order', '-created_at'], name='gn_order_created_idx'),
+        ]
     
     def __str__(self):
         return f'Notification for Order #{self.order.id} - {self.status}'
@@ -2,147 +2,268 @@
 Notification Service - formatting and sending order notifications.
 """
 import logging
-from typing import Optional
+from html import escape
+from typing import List, Optional, Tuple
 from django.conf import settings
+from django.db.models import Prefetch, QuerySet
 from telegram.error import TelegramError
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
-from orders.models import Order
+from orders.models import Order, OrderItem
 from telegram_bot.models import GroupNotification
 from telegram_bot.services.telegram import TelegramService
-from telegram_bot.exceptions import NotificationFailedError
+from telegram_bot.exceptions import BotNotConfiguredError, BotInactiveError, NotificationFailedError
 
 logger = logging.getLogger(__name__)
 
+# Choice value -> label lookups, built once instead of per message
+_PAYMENT_METHOD_LABELS = dict(Order.PAYMENT_METHOD_CHOICES)
+_STATUS_LABELS = dict(Order.STATUS_CHOICES)
+
+# Fixed fragments of the order message
+_RULE = "━━━━━━━━━━━━━━━━━━━━\n"
+_HEADER_RULE = _RULE + "\n"
+_ITEMS_HEADING = "\n🛍️ <b>Items:</b>\n"
+_SECTION_RULE = "\n" + _RULE
+
+# Order fields used by the notification messages
+_ORDER_MESSAGE_FIELDS = (
+    'id', 'full_name', 'phone_number', 'telegram_username', 'payment_method',
+    'subtotal', 'discount_total', 'total', 'status', 'comment', 'promo__code',
+)
+
+# Admin order URLs are this prefix + "<order_id>/change/"
+_ADMIN_ORDER_URL_PREFIX = f"{settings.ADMIN_URL_PREFIX or ''}/admin/orders/order/"
+
+# Callback data of the order buttons is "<action>:<order_id>"
+ORDER_SUCCESS_CALLBACK = "os"
+ORDER_CANCEL_CALLBACK = "oc"
+
+# Actions of the older "order_success_<id>" callback data, still on buttons
+# of messages sent before the short format
+_LEGACY_CALLBACK_ACTIONS = {
+    'order_success': ORDER_SUCCESS_CALLBACK,
+    'order_cancel': ORDER_CANCEL_CALLBACK,
+}
+
+
+def _escape(value) -> str:
+    """Escape user-entered text for Telegram HTML (quotes are fine in text)."""
+    return escape(str(value), quote=False)
+
+
+def _order_admin_url(order_id: int) -> str:
+    """Admin change page URL for an order."""
+    return f"{_ADMIN_ORDER_URL_PREFIX}{order_id}/change/"
+
+
+def _order_buttons(order_id: int, success_label: str, cancel_label: str) -> list:
+    """Keyboard row with close/cancel buttons for one order."""
+    return [
+        InlineKeyboardButton(success_label, callback_data=f"{ORDER_SUCCESS_CALLBACK}:{order_id}"),
+        InlineKeyboardButton(cancel_label, callback_data=f"{ORDER_CANCEL_CALLBACK}:{order_id}")
+    ]
+
+
+def parse_callback_data(data: str) -> Tuple[str, str]:
+    """
+    Split button callback data into (action, argument).
+    
+    Args:
+        data: Callback data, "<action>:<argument>" or the legacy
+            "order_success_<id>" / "order_cancel_<id>"
+            
+    Returns:
+        Tuple[str, str]: Action and argument (empty if there is none)
+    """
+    action, sep, argument = data.partition(':')
+    if sep:
+        return action, argument
+    
+    legacy_action, _, argument = data.rpartition('_')
+    if legacy_action in _LEGACY_CALLBACK_ACTIONS:
+        return _LEGACY_CALLBACK_ACTIONS[legacy_action], argument
+    return data, ''
+
 
 class NotificationService:
     """
     Service for formatting and sending order notifications to Telegram group.
     """
     
+    @staticmethod
+    def get_orders(order_ids: List[int]) -> QuerySet:
+        """
+        Get orders with everything the notification messages need.
+        
+        Promo is joined and items are prefetched (two queries in total), so
+        formatting the messages doesn't touch the DB.
+        
+        Args:
+            order_ids: Order IDs
+            
+        Returns:
+            QuerySet: Orders
+        """
+        items = OrderItem.objects.only('order_id', 'name_snapshot', 'qty', 'price_snapshot')
+        return Order.objects.filter(id__in=order_ids).select_related('promo').prefetch_related(
+            Prefetch('items', queryset=items)
+        ).only(*_ORDER_MESSAGE_FIELDS)
+    
+    @staticmethod
+    def _is_loaded(order: Order) -> bool:
+        """Check the order's items and promo are in memory (see get_orders)."""
+        if 'items' not in getattr(order, '_prefetched_objects_cache', {}):
+            return False
+        return order.promo_id is None or Order.promo.is_cached(order)
+    
+    @staticmethod
+    def _item_rows(order: Order):
+        """
+        Get (name_snapshot, qty, price_snapshot) tuples for the order's items.
+        
+        Reuses prefetched items if present, otherwise reads plain tuples
+        instead of building OrderItem instances.
+        """
+        prefetched = getattr(order, '_prefetched_objects_cache', {}).get('items')
+        if prefetched is not None:
+            return [(item.name_snapshot, item.qty, item.price_snapshot) for item in prefetched]
+        return order.items.values_list('name_snapshot', 'qty', 'price_snapshot')
+    
     @staticmethod
     def format_order_message(order: Order) -> str:
         """
         Format order as HTML message for Telegram.
         
+        User-entered fields are HTML-escaped so they can't inject markup.
+        
         Args:
             order: Order instance
             
         Returns:
             str: Formatted HTML message
         """
+        parts = []
+        append = parts.append
+        
         # Header
-        message = f"🛒 <b>NEW ORDER #{order.id}</b>\n"
-        message += "━━━━━━━━━━━━━━━━━━━━\n\n"
+        append(f"🛒 <b>NEW ORDER #{order.id}</b>\n")
+        append(_HEADER_RULE)
         
         # Customer info
-        message += f"👤 <b>Customer:</b> {order.full_name}\n"
-        message += f"📞 <b>Phone:</b> {order.phone_number}\n"
+        append(f"👤 <b>Customer:</b> {_escape(order.full_name)}\n")
+        append(f"📞 <b>Phone:</b> {_escape(order.phone_number)}\n")
         
         if order.telegram_username:
-            message += f"💬 <b>Telegram:</b> @{order.telegram_username}\n"
-        
-        message += "\n"
+            append(f"💬 <b>Telegram:</b> @{_escape(order.telegram_username)}\n")
         
         # Order items
-        message += "🛍️ <b>Items:</b>\n"
-        for item in order.items.all():
-            product_name = item.name_snapshot
-            qty = item.qty
-            price_snapshot = item.price_snapshot
-            total_item_price = price_snapshot * qty
-            
-            message += f"• {product_name} x{qty} - {float(total_item_price):,.0f} UZS\n"
+        append(_ITEMS_HEADING)
+        for name, qty, price_snapshot in NotificationService._item_rows(order):
+            append(f"• {_escape(name)} x{qty} - {float(price_snapshot * qty):,.0f} UZS\n")
         
-        message += "\n━━━━━━━━━━━━━━━━━━━━\n"
+        append(_SECTION_RULE)
         
         # Pricing
-        message += f"💰 <b>Subtotal:</b> {float(order.subtotal):,.0f} UZS\n"
+        append(f"💰 <b>Subtotal:</b> {float(order.subtotal):,.0f} UZS\n")
         
         if order.promo:
             discount_amount = order.discount_total
-            message += f"🎁 <b>Promo Code:</b> {order.promo.code} (-{float(discount_amount):,.0f} UZS)\n"
+            append(f"🎁 <b>Promo Code:</b> {_escape(order.promo.code)} (-{float(discount_amount):,.0f} UZS)\n")
         
-        message += f"💳 <b>Total:</b> <b>{float(order.total):,.0f} UZS</b>\n\n"
+        append(f"💳 <b>Total:</b> <b>{float(order.total):,.0f} UZS</b>\n\n")
         
         # Additional info
         if order.comment:
-            message += f"📝 <b>Comment:</b> {order.comment}\n"
+            append(f"📝 <b>Comment:</b> {_escape(order.comment)}\n")
         
         # Payment method
-        payment_method_display = dict(Order.PAYMENT_METHOD_CHOICES).get(order.payment_method, order.payment_method)
-        message += f"💳 <b>Payment:</b> {payment_method_display}\n"
+        payment_method_display = _PAYMENT_METHOD_LABELS.get(order.payment_method, order.payment_method)
+        append(f"💳 <b>Payment:</b> {payment_method_display}\n")
         
         # Order status
-        status_display = dict(Order.STATUS_CHOICES).get(order.status, order.status)
-        message += f"📦 <b>Status:</b> {status_display}\n\n"
+        status_display = _STATUS_LABELS.get(order.status, order.status)
+        append(f"📦 <b>Status:</b> {status_display}\n\n")
         
         # Admin link
-        admin_url = f"{settings.ADMIN_URL_PREFIX or ''}/admin/orders/order/{order.id}/change/"
-        message += f"🔗 <a href='{admin_url}'>Manage Order</a>"
+        admin_url = _order_admin_url(order.id)
+        append(f"🔗 <a href='{admin_url}'>Manage Order</a>")
+        
+        return ''.join(parts)
+    
+    @staticmethod
+    def format_orders_message(orders: List[Order]) -> str:
+        """
+        Format several orders as one compact HTML message for Telegram.
+        
+        Used when orders arrive faster than the group can receive messages.
+        
+        Args:
+            orders: Order instances
+            
+        Returns:
+            str: Formatted HTML message
+        """
+        parts = [f"🛒 <b>{len(orders)} NEW ORDERS</b>\n", _HEADER_RULE]
+        append = parts.append
+        
+        for order in orders:
+            append(
+                f"• <b>#{order.id}</b> {_escape(order.full_name)}, {_escape(order.phone_number)} - "
+                f"<b>{float(order.total):,.0f} UZS</b> "
+                f"(<a href='{_order_admin_url(order.id)}'>Manage</a>)\n"
+            )
         
-        return message
+        return ''.join(parts)
     
     @staticmethod
-    async def send_order_notification(order: Order) -> GroupNotification:
+    async def send_order_notification(order: Order, record_failure: bool = True) -> GroupNotification:
         """
         Send order notification to managers group.
         
         Args:
             order: Order instance
+            record_failure: Save a FAILED record if sending fails (callers
+                that retry pass False and record the final failure themselves)
             
         Returns:
             GroupNotification: Created notification record
             
         Raises:
+            BotNotConfiguredError: If bot is not configured (nothing is recorded)
+            BotInactiveError: If bot is inactive (nothing is recorded)
             NotificationFailedError: If notification sending failed
         """
         from asgiref.sync import sync_to_async
         
-        # Create notification record (sync)
-        notification = await sync_to_async(GroupNotification.objects.create)(
-            order=order,
-            status=GroupNotification.STATUS_PENDING
-        )
+        # Notification record is saved once, with the outcome of the send
+        notification = GroupNotification(order=order, status=GroupNotification.STATUS_PENDING)
         
         try:
-            # Get bot config (sync -> async)
-            def _get_config():
-                from telegram_bot.models import BotConfig
-                config = BotConfig.objects.first()
-                if not config:
-                    from telegram_bot.exceptions import BotNotConfiguredError
-                    raise BotNotConfiguredError()
-                if not config.is_active:
-                    from telegram_bot.exceptions import BotInactiveError
-                    raise BotInactiveError()
-                return config
-            
-            config = await sync_to_async(_get_config)()
-            
-            # Format message (sync -> async)
-            message_text = await sync_to_async(NotificationService.format_order_message)(order)
+            # Get bot config (cached; only hits the DB when the cache is cold)
+            config = await TelegramService.get_bot_config_async()
+            
+            # Load promo and items up front unless the caller did
+            # (get_orders), so formatting is pure CPU with no DB access
+            if not NotificationService._is_loaded(order):
+                order = await NotificationService.get_orders([order.id]).aget()
+            message_text = NotificationService.format_order_message(order)
             
             # Create inline keyboard with action buttons
-            keyboard = [
-                [
-                    InlineKeyboardButton("✅ Close as Successful", callback_data=f"order_success_{order.id}"),
-                    InlineKeyboardButton("❌ Cancel Order", callback_data=f"order_cancel_{order.id}")
-                ]
-            ]
+            keyboard = [_order_buttons(order.id, "✅ Close as Successful", "❌ Cancel Order")]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            # Send message with inline keyboard (async) - pass token directly to avoid sync DB calls in async
-            message_id = await TelegramService.send_message(
-                chat_id=config.notification_group_id,
-                text=message_text,
-                parse_mode='HTML',
-                disable_web_page_preview=True,
-                reply_markup=reply_markup,
-                bot_token=config.bot_token
-            )
+            # Send message with inline keyboard (async), reusing the loaded config
+            with TelegramService.use_config(config):
+                message_id = await TelegramService.send_message(
+                    chat_id=config.notification_group_id,
+                    text=message_text,
+                    parse_mode='HTML',
+                    disable_web_page_preview=True,
+                    reply_markup=reply_markup
+                )
             
-            # Update notification record (sync)
+            # Save notification record (sync)
             notification.status = GroupNotification.STATUS_SENT
             notification.message_id = str(message_id)
             await sync_to_async(notification.save)()
@@ -150,21 +271,118 @@ class NotificationService:
             logger.info(f'Order #{order.id} notification sent successfully: {message_id}')
             return notification
             
+        except (BotNotConfiguredError, BotInactiveError):
+            # Not a send failure: the bot is off, so there is nothing to record
+            raise
+            
         except (TelegramError, Exception) as e:
-            # Update notification record with error (sync)
-            notification.status = GroupNotification.STATUS_FAILED
-            notification.error_message = str(e)
-            await sync_to_async(notification.save)()
+            # Save notification record with error
+            if record_failure:
+                await NotificationService.save_failed_notifications([order], str(e))
             
             logger.error(f'Failed to send order #{order.id} notification: {e}')
-            raise NotificationFailedError(str(e))
+            raise NotificationFailedError(str(e)) from e
+    
+    @staticmethod
+    async def send_orders_notification(
+        orders: List[Order],
+        record_failure: bool = True
+    ) -> List[GroupNotification]:
+        """
+        Send one grouped notification for several orders to managers group.
+        
+        Each order keeps its own GroupNotification record; all of them share
+        the message ID. The keyboard has one close/cancel row per order.
+        
+        Args:
+            orders: Order instances
+            record_failure: Save FAILED records if sending fails (see
+                send_order_notification)
+            
+        Returns:
+            List[GroupNotification]: Created notification records
+            
+        Raises:
+            BotNotConfiguredError: If bot is not configured (nothing is recorded)
+            BotInactiveError: If bot is inactive (nothing is recorded)
+            NotificationFailedError: If notification sending failed
+        """
+        from asgiref.sync import sync_to_async
+        
+        # Notification records are saved once, with the outcome of the send
+        notifications = [
+            GroupNotification(order=order, status=GroupNotification.STATUS_PENDING)
+            for order in orders
+        ]
+        order_ids = ', '.join(f'#{order.id}' for order in orders)
+        
+        def _save_notifications(**fields):
+            for notification in notifications:
+                for name, value in fields.items():
+                    setattr(notification, name, value)
+            GroupNotification.objects.bulk_create(notifications)
+        
+        try:
+            config = await TelegramService.get_bot_config_async()
+            
+            message_text = NotificationService.format_orders_message(orders)
+            reply_markup = InlineKeyboardMarkup([
+                _order_buttons(order.id, f"✅ #{order.id}", f"❌ #{order.id}")
+                for order in orders
+            ])
+            
+            with TelegramService.use_config(config):
+                message_id = await TelegramService.send_message(
+                    chat_id=config.notification_group_id,
+                    text=message_text,
+                    parse_mode='HTML',
+                    disable_web_page_preview=True,
+                    reply_markup=reply_markup
+                )
+            
+            await sync_to_async(_save_notifications)(
+                status=GroupNotification.STATUS_SENT,
+                message_id=str(message_id)
+            )
+            
+            logger.info(f'Orders {order_ids} notification sent successfully: {message_id}')
+            return notifications
+            
+        except (BotNotConfiguredError, BotInactiveError):
+            raise
+            
+        except (TelegramError, Exception) as e:
+            if record_failure:
+                await NotificationService.save_failed_notifications(orders, str(e))
+            
+            logger.error(f'Failed to send orders {order_ids} notification: {e}')
+            raise NotificationFailedError(str(e)) from e
+    
+    @staticmethod
+    async def save_failed_notifications(orders: List[Order], error: str) -> None:
+        """
+        Save a FAILED notification record for each order.
+        
+        Args:
+            orders: Order instances whose notification could not be sent
+            error: Error message
+        """
+        await GroupNotification.objects.abulk_create([
+            GroupNotification(
+                order=order,
+                status=GroupNotification.STATUS_FAILED,
+                error_message=error
+            )
+            for order in orders
+        ])
     
     @staticmethod
     def send_order_notification_sync(order: Order) -> GroupNotification:
         """
         Synchronous wrapper for send_order_notification.
         
-        This method can be called from Django signals and views.
+        This method can be called from Django signals and views, but not
+        from async code (it blocks until the notification is sent).
         
         Args:
             order: Order instance
@@ -172,17 +390,9 @@ class NotificationService:
         Returns:
             GroupNotification: Created notification record
         """
-        import asyncio
+        from telegram_bot import worker
         
-        try:
-            # Create new event loop if needed
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        # Run async function in sync context
-        return loop.run_until_complete(
-            NotificationService.send_order_notification(order)
-        )
+        # Run on the shared worker loop (reuses its Bot connection pool)
+        # instead of creating an event loop per call
+        return worker.run(NotificationService.send_order_notification(order))
 
@@ -1,16 +1,125 @@
 """
 Telegram Service - base class for Telegram API operations.
 """
+import asyncio
 import logging
-from typing import Optional
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Set, Tuple
+from django.utils import timezone
 from telegram import Bot
+from telegram.request import HTTPXRequest
 from telegram.error import TelegramError
 
-from telegram_bot.models import BotConfig
+from telegram_bot.models import BotConfig, SINGLETON_PK
 from telegram_bot.exceptions import BotNotConfiguredError, BotInactiveError
 
 logger = logging.getLogger(__name__)
 
+# BotConfig is a singleton row read on almost every update/notification.
+# Cache it in-process as (expires_at, config); telegram_bot.signals clears
+# the cache on save/delete, the TTL bounds staleness across processes.
+BOT_CONFIG_CACHE_TTL = 60
+
+_config_cache: Tuple[float, Optional[BotConfig]] = (0.0, None)
+
+# Bot instances keyed by (token, event loop), so the underlying HTTP
+# connection pool is reused across sends. A Bot's pool is bound to the loop
+# it runs on, so each loop gets its own Bot (None is the key for sync code).
+_bot_cache: Dict[Tuple[str, Optional[asyncio.AbstractEventLoop]], Bot] = {}
+_bot_cache_lock = threading.Lock()
+
+# Pool shutdowns scheduled on a running loop (it only keeps weak references)
+_closing_tasks: Set[asyncio.Task] = set()
+
+# Connection pool of each cached Bot. PTB's default is a single connection
+# with a 1s pool timeout, which concurrent sends on a shared Bot outgrow.
+BOT_CONNECTION_POOL_SIZE = 20
+BOT_POOL_TIMEOUT = 5.0
+
+# Config already loaded by the caller (e.g. a notification being sent), so
+# send_message doesn't look it up again. Set via TelegramService.use_config().
+_current_config: ContextVar[Optional[BotConfig]] = ContextVar('telegram_bot_config', default=None)
+
+# Telegram Bot API limits: ~30 messages/second overall, ~1 message/second per chat
+GLOBAL_MESSAGES_PER_SECOND = 30
+CHAT_MESSAGES_PER_SECOND = 1
+
+
+class _RateLimiter:
+    """
+    Async rate limiter (GCRA): at most `rate` acquisitions per second,
+    allowing bursts of up to `burst`.
+    
+    Slots are reserved under a threading lock and waited for with
+    asyncio.sleep, so one limiter works across threads and event loops.
+    """
+    
+    def __init__(self, rate: float, burst: int = 1):
+        self._interval = 1.0 / rate
+        self._tolerance = self._interval * (burst - 1)
+        self._tat = 0.0  # theoretical arrival time of the next free slot
+        self._lock = threading.Lock()
+    
+    async def acquire(self) -> None:
+        """Wait until a slot is available."""
+        with self._lock:
+            now = time.monotonic()
+            tat = max(self._tat, now)
+            delay = tat - self._tolerance - now
+            self._tat = tat + self._interval
+        
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_global_limiter = _RateLimiter(GLOBAL_MESSAGES_PER_SECOND, burst=GLOBAL_MESSAGES_PER_SECOND)
+_chat_limiters: Dict[str, _RateLimiter] = {}
+_chat_limiters_lock = threading.Lock()
+
+
+def _close_bot_request(bot: Bot, loop: Optional[asyncio.AbstractEventLoop], wait: bool = False) -> None:
+    """
+    Close the HTTP connection pool of a cached Bot on the loop it was used on.
+    
+    Cached bots are never initialize()d, so Bot.shutdown() would be a no-op;
+    the request object that holds the pool is closed directly. Bots whose loop
+    is gone (or that were never used on one) are left to garbage collection.
+    
+    Args:
+        bot: Bot instance dropped from the cache
+        loop: Event loop the Bot was cached for
+        wait: Block until the pool is closed (sync callers only)
+    """
+    if loop is None or loop.is_closed():
+        return
+    
+    try:
+        if loop is asyncio._get_running_loop():
+            task = loop.create_task(bot.request.shutdown())
+            _closing_tasks.add(task)
+            task.add_done_callback(_closing_tasks.discard)
+        elif loop.is_running():
+            future = asyncio.run_coroutine_threadsafe(bot.request.shutdown(), loop)
+            if wait:
+                future.result(timeout=5)
+        elif wait:
+            loop.run_until_complete(bot.request.shutdown())
+    except Exception as e:
+        logger.warning(f'Failed to close bot HTTP pool: {e}')
+
+
+def _get_chat_limiter(chat_id) -> _RateLimiter:
+    """Get (or create) the rate limiter for one chat."""
+    key = str(chat_id)
+    with _chat_limiters_lock:
+        limiter = _chat_limiters.get(key)
+        if limiter is None:
+            limiter = _chat_limiters[key] = _RateLimiter(CHAT_MESSAGES_PER_SECOND)
+        return limiter
+
 
 class TelegramService:
     """
@@ -19,6 +128,148 @@ class TelegramService:
     Provides methods for sending messages, setting up webhooks, etc.
     """
     
+    @staticmethod
+    def get_cached_config() -> Tuple[bool, Optional[BotConfig]]:
+        """
+        Read bot configuration from the in-process cache (no DB access).
+        
+        Returns:
+            Tuple[bool, Optional[BotConfig]]: (hit, config); config may be None
+                on a hit if the bot is not configured
+        """
+        expires_at, config = _config_cache
+        return expires_at > time.monotonic(), config
+    
+    @staticmethod
+    def load_config() -> Optional[BotConfig]:
+        """
+        Load bot configuration from the DB and refresh the cache (sync).
+        
+        Returns:
+            Optional[BotConfig]: Bot configuration or None if not configured
+        """
+        global _config_cache
+        config = BotConfig.objects.first()
+        _config_cache = (time.monotonic() + BOT_CONFIG_CACHE_TTL, config)
+        return config
+    
+    @staticmethod
+    async def load_config_async() -> Optional[BotConfig]:
+        """
+        Get bot configuration from the cache, loading it from the DB on a miss.
+        
+        Unlike get_bot_config_async, doesn't check that the bot is configured
+        and active.
+        
+        Returns:
+            Optional[BotConfig]: Bot configuration or None if not configured
+        """
+        from asgiref.sync import sync_to_async
+        
+        # Only hop to a thread for the DB when the cache is cold
+        hit, config = TelegramService.get_cached_config()
+        if not hit:
+            config = await sync_to_async(TelegramService.load_config)()
+        return config
+    
+    @staticmethod
+    def update_webhook_url(webhook_url: Optional[str]) -> bool:
+        """
+        Store the webhook URL on the bot configuration.
+        
+        Writes just that column with one UPDATE (no SELECT first) and drops
+        the cached configuration, since update() doesn't send post_save.
+        
+        Args:
+            webhook_url: Webhook URL, or None when the webhook was deleted
+            
+        Returns:
+            bool: True if the bot configuration exists and was updated
+        """
+        updated = BotConfig.objects.filter(pk=SINGLETON_PK).update(
+            webhook_url=webhook_url,
+            updated_at=timezone.now()
+        )
+        TelegramService.clear_config_cache()
+        return bool(updated)
+    
+    @staticmethod
+    def clear_config_cache() -> None:
+        """Drop the cached bot configuration (called when BotConfig changes)."""
+        global _config_cache
+        _config_cache = (0.0, None)
+    
+    @staticmethod
+    def get_cached_bot(token: str) -> Bot:
+        """
+        Get a shared Bot instance for token on the current event loop.
+        
+        Args:
+            token: Bot token
+            
+        Returns:
+            Bot: Telegram Bot instance
+        """
+        # None in sync code; avoids raising RuntimeError on every sync call
+        loop = asyncio._get_running_loop()
+        
+        with _bot_cache_lock:
+            bot = _bot_cache.get((token, loop))
+            if bot is not None:
+                return bot
+            
+            # Evict Bots whose loop has closed and Bots for an old token on
+            # this loop, so the cache doesn't grow with every loop or token
+            evicted = [
+                (_bot_cache.pop(key), key[1])
+                for key in list(_bot_cache)
+                if (key[1] is not None and key[1].is_closed()) or (key[1] is loop and key[0] != token)
+            ]
+            
+            bot = Bot(
+                token=token,
+                request=HTTPXRequest(
+                    connection_pool_size=BOT_CONNECTION_POOL_SIZE,
+                    pool_timeout=BOT_POOL_TIMEOUT
+                )
+            )
+            _bot_cache[(token, loop)] = bot
+        
+        for old_bot, old_loop in evicted:
+            _close_bot_request(old_bot, old_loop)
+        
+        return bot
+    
+    @staticmethod
+    def close_bots() -> None:
+        """
+        Close the HTTP connection pools of cached Bot instances.
+        
+        Each pool is closed on the event loop it was used on; Bots whose loop
+        is gone (or that were never used on one) are just dropped.
+        """
+        with _bot_cache_lock:
+            entries = [(bot, key[1]) for key, bot in _bot_cache.items()]
+            _bot_cache.clear()
+        
+        for bot, loop in entries:
+            _close_bot_request(bot, loop, wait=True)
+    
+    @staticmethod
+    @contextmanager
+    def use_config(config: BotConfig) -> Iterator[BotConfig]:
+        """
+        Make config the bot configuration for sends in the current context.
+        
+        Args:
+            config: Bot configuration (already checked to be active)
+        """
+        token = _current_config.set(config)
+        try:
+            yield config
+        finally:
+            _current_config.reset(token)
+    
     @staticmethod
     def get_bot_config() -> BotConfig:
         """
@@ -31,11 +282,14 @@ class TelegramService:
             BotNotConfiguredError: If bot is not configured
             BotInactiveError: If bot is inactive
         """
-        try:
-            config = BotConfig.objects.first()
-        except Exception as e:
-            logger.error(f'Failed to get bot config: {e}')
-            raise BotNotConfiguredError()
+        # Only hit the DB when the cache is cold
+        hit, config = TelegramService.get_cached_config()
+        if not hit:
+            try:
+                config = TelegramService.load_config()
+            except Exception as e:
+                logger.error(f'Failed to get bot config: {e}')
+                raise BotNotConfiguredError()
         
         if not config:
             raise BotNotConfiguredError()
@@ -57,16 +311,11 @@ class TelegramService:
             BotNotConfiguredError: If bot is not configured
             BotInactiveError: If bot is inactive
         """
-        from asgiref.sync import sync_to_async
-        
-        def _get_config():
-            try:
-                return BotConfig.objects.first()
-            except Exception as e:
-                logger.error(f'Failed to get bot config: {e}')
-                raise BotNotConfiguredError()
-        
-        config = await sync_to_async(_get_config)()
+        try:
+            config = await TelegramService.load_config_async()
+        except Exception as e:
+            logger.error(f'Failed to get bot config: {e}')
+            raise BotNotConfiguredError()
         
         if not config:
             raise BotNotConfiguredError()
@@ -89,7 +338,7 @@ class TelegramService:
             BotInactiveError: If bot is inactive
         """
         config = TelegramService.get_bot_config()
-        return Bot(token=config.bot_token)
+        return TelegramService.get_cached_bot(config.bot_token)
     
     @staticmethod
     async def get_bot_async() -> Bot:
@@ -104,7 +353,7 @@ class TelegramService:
             BotInactiveError: If bot is inactive
         """
         config = await TelegramService.get_bot_config_async()
-        return Bot(token=config.bot_token)
+        return TelegramService.get_cached_bot(config.bot_token)
     
     @staticmethod
     async def send_message(
@@ -112,8 +361,7 @@ class TelegramService:
         text: str,
         parse_mode: str = 'HTML',
         disable_web_page_preview: bool = False,
-        reply_markup = None,
-        bot_token: Optional[str] = None
+        reply_markup = None
     ) -> Optional[int]:
         """
         Send message to Telegram chat.
@@ -124,7 +372,6 @@ class TelegramService:
             parse_mode: Parse mode (HTML or Markdown)
             disable_web_page_preview: Disable link previews
             reply_markup: Inline keyboard markup
-            bot_token: Bot token (if not provided, will get from config)
             
         Returns:
             int: Message ID if sent successfully, None otherwise
@@ -132,11 +379,19 @@ class TelegramService:
         Raises:
             NotificationFailedError: If message sending failed
         """
-        if bot_token:
-            bot = Bot(token=bot_token)
+        # Use the config set by the caller (use_config) if any, else load it
+        config = _current_config.get()
+        if config is not None:
+            bot = TelegramService.get_cached_bot(config.bot_token)
         else:
             bot = await TelegramService.get_bot_async()
         
+        # Stay under Telegram's flood limits instead of collecting 429s
+        await _get_chat_limiter(chat_id).acquire()
+        await _global_limiter.acquire()
+        
+        # A 429 (RetryAfter) is raised as is: the notification worker owns
+        # retries and reschedules the batch after retry_after
         try:
             message = await bot.send_message(
                 chat_id=chat_id,
@@ -165,7 +420,7 @@ class TelegramService:
         Raises:
             WebhookSetupError: If webhook setup failed
         """
-        bot = TelegramService.get_bot()
+        bot = await TelegramService.get_bot_async()
         
         try:
             result = await bot.set_webhook(url=webhook_url)
@@ -183,7 +438,7 @@ class TelegramService:
         Returns:
             bool: True if webhook was deleted successfully
         """
-        bot = TelegramService.get_bot()
+        bot = await TelegramService.get_bot_async()
         
         try:
             result = await bot.delete_webhook()
@@ -201,7 +456,7 @@ class TelegramService:
         Returns:
             dict: Webhook info
         """
-        bot = TelegramService.get_bot()
+        bot = await TelegramService.get_bot_async()
         
         try:
             info = await bot.get_webhook_info()
@@ -1,16 +1,141 @@
 """
 Webhook Service - handling incoming Telegram updates.
 """
+import asyncio
 import logging
-from typing import Dict, Any, Optional
-from telegram import Update
-from telegram.ext import Application
+import threading
+from decimal import Decimal
+from typing import Dict, Any, Optional, Tuple
+import httpx
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from telegram import Update, InlineKeyboardMarkup
 from asgiref.sync import sync_to_async
 
 from telegram_bot.services.telegram import TelegramService
+from telegram_bot.services.notification import (
+    ORDER_CANCEL_CALLBACK,
+    ORDER_SUCCESS_CALLBACK,
+    _escape,
+    parse_callback_data,
+)
 
 logger = logging.getLogger(__name__)
 
+# Shared HTTP client for the /health API check, kept with the event loop it
+# belongs to (httpx connection pools can't be shared across loops)
+_http_client: Optional[Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = None
+_http_client_lock = threading.Lock()
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Get the shared HTTP client for the running event loop, creating it on first use."""
+    global _http_client
+    loop = asyncio.get_running_loop()
+    
+    with _http_client_lock:
+        if _http_client is not None and _http_client[1] is loop:
+            return _http_client[0]
+        
+        client = httpx.AsyncClient(
+            timeout=5.0,
+            limits=httpx.Limits(max_keepalive_connections=10)
+        )
+        _http_client = (client, loop)
+        return client
+
+
+def close_http_client() -> None:
+    """Close the shared HTTP client on its own event loop (see worker.close_all)."""
+    global _http_client
+    with _http_client_lock:
+        entry, _http_client = _http_client, None
+    
+    if entry is None:
+        return
+    
+    client, loop = entry
+    try:
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+        elif not loop.is_closed():
+            loop.run_until_complete(client.aclose())
+    except Exception as e:
+        logger.warning(f'Failed to close HTTP client: {e}')
+
+
+# Fixed command replies
+_WELCOME_TEXT = (
+    '👋 Welcome to MDIST WEAR!\n'
+    'The official merchandise project of MDIS Tashkent.\n\n'
+    'Here you can browse, order, and represent your university with style.\n\n'
+)
+_START_TEXT = _WELCOME_TEXT + 'Please click the button below to open our shop👇'
+_START_NO_MINI_APP_TEXT = _WELCOME_TEXT + 'Mini App is currently being set up. Please check back later!'
+_HELP_TEXT = (
+    '📋 <b>Доступные команды:</b>\n\n'
+    '/start - Начать\n'
+    '/help - Помощь\n'
+    '/status - Статус бота\n'
+    '/health - Проверка связи с API'
+)
+_NOT_CONFIGURED_TEXT = '❌ Бот не настроен!'
+_UNKNOWN_COMMAND_TEXT = '❓ Неизвестная команда. Используйте /help для списка команд.'
+_STATUS_HEADER = '🤖 <b>СТАТУС БОТА</b>\n━━━━━━━━━━━━━━━━\n\n'
+_HEALTH_HEADER = '🏥 <b>HEALTH CHECK</b>\n━━━━━━━━━━━━━━━━\n\n'
+
+
+def _confirm_order_sync(order_id: str) -> Optional[Tuple[str, Decimal]]:
+    """
+    Mark an order confirmed with a single UPDATE.
+    
+    Args:
+        order_id: Order ID from the callback data
+        
+    Returns:
+        (full_name, total) of the order, or None if it doesn't exist
+    """
+    from orders.models import Order
+    try:
+        with transaction.atomic():
+            updated = Order.objects.filter(id=order_id).update(
+                status=Order.STATUS_CONFIRMED,
+                updated_at=timezone.now()
+            )
+            if not updated:
+                return None
+            return Order.objects.values_list('full_name', 'total').get(id=order_id)
+    finally:
+        # Runs on a pool thread, which Django's request cycle doesn't clean up
+        close_old_connections()
+
+
+def _delete_order_sync(order_id: str) -> Optional[Tuple[str, Decimal]]:
+    """
+    Delete an order completely from DB.
+    
+    Args:
+        order_id: Order ID from the callback data
+        
+    Returns:
+        (full_name, total) of the deleted order, or None if it doesn't exist
+    """
+    from orders.models import Order
+    try:
+        with transaction.atomic():
+            order = Order.objects.filter(id=order_id).values_list('full_name', 'total').first()
+            if order is not None:
+                Order.objects.filter(id=order_id).delete()
+            return order
+    finally:
+        close_old_connections()
+
+
+# Callback DB work doesn't need Django's single sync thread, so concurrent
+# callbacks don't queue up behind each other
+_confirm_order = sync_to_async(_confirm_order_sync, thread_sensitive=False)
+_delete_order = sync_to_async(_delete_order_sync, thread_sensitive=False)
+
 
 class WebhookService:
     """
@@ -32,11 +157,9 @@ class WebhookService:
             # Get bot config (async)
             config = await TelegramService.get_bot_config_async()
             
-            # Create application for update processing
-            application = Application.builder().token(config.bot_token).build()
-            
-            # Create Update object from data
-            update = Update.de_json(update_data, application.bot)
+            # Create Update object from data, bound to the shared Bot (no
+            # per-update Application/HTTP client)
+            update = Update.de_json(update_data, TelegramService.get_cached_bot(config.bot_token))
             
             if not update:
                 logger.warning('Invalid update data received')
@@ -97,12 +220,7 @@ class WebhookService:
         
         if command == '/start':
             # Get bot config to check for Mini App URL
-            def _get_config():
-                from telegram_bot.models import BotConfig
-                config = BotConfig.objects.first()
-                return config
-            
-            config = await sync_to_async(_get_config)()
+            config = await TelegramService.load_config_async()
             
             if config and config.mini_app_url:
                 # Create inline keyboard with Mini App button
@@ -112,40 +230,17 @@ class WebhookService:
                 ]
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
-                await message.reply_text(
-                    '👋 Welcome to MDIST WEAR!\n'
-                    'The official merchandise project of MDIS Tashkent.\n\n'
-                    'Here you can browse, order, and represent your university with style.\n\n'
-                    'Please click the button below to open our shop👇',
-                    reply_markup=reply_markup
-                )
+                await message.reply_text(_START_TEXT, reply_markup=reply_markup)
             else:
-                await message.reply_text(
-                    '👋 Welcome to MDIST WEAR!\n'
-                    'The official merchandise project of MDIS Tashkent.\n\n'
-                    'Here you can browse, order, and represent your university with style.\n\n'
-                    'Mini App is currently being set up. Please check back later!'
-                )
+                await message.reply_text(_START_NO_MINI_APP_TEXT)
         elif command == '/help':
-            await message.reply_text(
-                '📋 <b>Доступные команды:</b>\n\n'
-                '/start - Начать\n'
-                '/help - Помощь\n'
-                '/status - Статус бота\n'
-                '/health - Проверка связи с API',
-                parse_mode='HTML'
-            )
+            await message.reply_text(_HELP_TEXT, parse_mode='HTML')
         elif command == '/status':
-            # Get bot config (sync -> async)
-            def _get_config():
-                from telegram_bot.models import BotConfig
-                config = BotConfig.objects.first()
-                return config
-            
-            config = await sync_to_async(_get_config)()
+            # Get bot config (cached)
+            config = await TelegramService.load_config_async()
             
             if not config:
-                await message.reply_text('❌ Бот не настроен!')
+                await message.reply_text(_NOT_CONFIGURED_TEXT)
                 return
             
             status_text = '✅ Активен' if config.is_active else '❌ Неактивен'
@@ -155,8 +250,7 @@ class WebhookService:
             webhook_status = '✅ Настроен' if webhook_info.get('url') else '⚠️ Не настроен'
             
             response = (
-                f'🤖 <b>СТАТУС БОТА</b>\n'
-                f'━━━━━━━━━━━━━━━━\n\n'
+                f'{_STATUS_HEADER}'
                 f'🔌 <b>Бот:</b> {status_text}\n'
                 f'📡 <b>Webhook:</b> {webhook_status}\n'
                 f'📢 <b>Группа ID:</b> <code>{config.notification_group_id}</code>\n\n'
@@ -169,55 +263,44 @@ class WebhookService:
             await message.reply_text(response, parse_mode='HTML')
             
         elif command == '/health':
-            import httpx
             from django.conf import settings
             
-            # Check API health
+            # Check API health (pooled client keeps the connection alive between checks)
             try:
-                async with httpx.AsyncClient() as client:
-                    api_response = await client.get(
-                        f'{settings.ADMIN_URL_PREFIX}/health/',
-                        timeout=5.0
-                    )
-                    
-                    if api_response.status_code == 200:
-                        api_status = '✅ OK'
-                        api_details = api_response.json()
-                    else:
-                        api_status = f'❌ Error {api_response.status_code}'
-                        api_details = {}
+                api_response = await _get_http_client().get(
+                    f'{settings.ADMIN_URL_PREFIX}/health/',
+                    timeout=5.0
+                )
+                
+                if api_response.status_code == 200:
+                    api_status = '✅ OK'
+                    api_details = api_response.json()
+                else:
+                    api_status = f'❌ Error {api_response.status_code}'
+                    api_details = {}
             except Exception as e:
                 api_status = f'❌ Недоступен'
                 api_details = {'error': str(e)}
             
-            # Get bot config (sync -> async)
-            def _get_config():
-                from telegram_bot.models import BotConfig
-                config = BotConfig.objects.first()
-                if config:
-                    return config.is_active
-                return False
-            
-            bot_active = await sync_to_async(_get_config)()
+            # Get bot config (cached)
+            config = await TelegramService.load_config_async()
+            bot_active = bool(config and config.is_active)
             bot_status = '✅ Активен' if bot_active else '❌ Неактивен'
             
-            # Get notification stats (sync -> async)
-            def _get_stats():
-                from telegram_bot.models import GroupNotification
-                total = GroupNotification.objects.count()
-                sent = GroupNotification.objects.filter(
-                    status=GroupNotification.STATUS_SENT
-                ).count()
-                failed = GroupNotification.objects.filter(
-                    status=GroupNotification.STATUS_FAILED
-                ).count()
-                return total, sent, failed
-            
-            total_notifications, sent_notifications, failed_notifications = await sync_to_async(_get_stats)()
+            # Get notification stats in one query
+            from django.db.models import Count, Q
+            from telegram_bot.models import GroupNotification
+            stats = await GroupNotification.objects.aaggregate(
+                total=Count('id'),
+                sent=Count('id', filter=Q(status=GroupNotification.STATUS_SENT)),
+                failed=Count('id', filter=Q(status=GroupNotification.STATUS_FAILED)),
+            )
+            total_notifications, sent_notifications, failed_notifications = (
+                stats['total'], stats['sent'], stats['failed']
+            )
             
             response_text = (
-                f'🏥 <b>HEALTH CHECK</b>\n'
-                f'━━━━━━━━━━━━━━━━\n\n'
+                f'{_HEALTH_HEADER}'
                 f'🤖 <b>Bot:</b> {bot_status}\n'
                 f'🌐 <b>API:</b> {api_status}\n\n'
                 f'📊 <b>Статистика уведомлений:</b>\n'
@@ -232,9 +315,7 @@ class WebhookService:
             await message.reply_text(response_text, parse_mode='HTML')
             
         else:
-            await message.reply_text(
-                '❓ Неизвестная команда. Используйте /help для списка команд.'
-            )
+            await message.reply_text(_UNKNOWN_COMMAND_TEXT)
     
     @staticmethod
     async def _handle_callback_query(update: Update) -> None:
@@ -253,16 +334,11 @@ class WebhookService:
         logger.info(f'Callback query: {callback_data}')
         
         try:
-            if callback_data.startswith('order_success_'):
-                # Handle successful order closure
-                order_id = callback_data.replace('order_success_', '')
-                await WebhookService._handle_order_success(query, order_id)
-                
-            elif callback_data.startswith('order_cancel_'):
-                # Handle order cancellation
-                order_id = callback_data.replace('order_cancel_', '')
-                await WebhookService._handle_order_cancel(query, order_id)
-                
+            action, order_id = parse_callback_data(callback_data)
+            handler = CALLBACK_HANDLERS.get(action)
+            
+            if handler is not None:
+                await handler(query, order_id)
             else:
                 await query.answer("❓ Неизвестная команда")
                 
@@ -270,41 +346,69 @@ class WebhookService:
             logger.error(f'Error handling callback query {callback_data}: {e}')
             await query.answer("❌ Произошла ошибка при обработке команды")
     
+    @staticmethod
+    async def _finish_order_message(query, order_id: str, text: str) -> None:
+        """
+        Show the result of an order action on its notification message.
+        
+        A single-order message is replaced with text. In a grouped message
+        (one row of order buttons per order) only this order's row is
+        removed and the result is posted as a reply, so the other orders
+        stay listed and actionable.
+        
+        Args:
+            query: Telegram CallbackQuery
+            order_id: Order ID the action was taken on
+            text: HTML result text
+        """
+        message = query.message
+        rows = message.reply_markup.inline_keyboard if message and message.reply_markup else ()
+        order_rows = [
+            row for row in rows
+            if any(
+                parse_callback_data(button.callback_data or '')[0] in CALLBACK_HANDLERS
+                for button in row
+            )
+        ]
+        if len(order_rows) <= 1:
+            await query.edit_message_text(text=text, parse_mode='HTML')
+            return
+        
+        remaining = [
+            row for row in rows
+            if not any(
+                parse_callback_data(button.callback_data or '')[1] == order_id
+                for button in row
+            )
+        ]
+        await query.edit_message_reply_markup(
+            reply_markup=InlineKeyboardMarkup(remaining) if remaining else None
+        )
+        await message.reply_text(text, parse_mode='HTML')
+    
     @staticmethod
     async def _handle_order_success(query, order_id: str) -> None:
         """
         Handle successful order closure.
         """
         try:
-            # Get order from DB (sync -> async)
-            def _get_order():
-                from orders.models import Order
-                try:
-                    return Order.objects.get(id=order_id)
-                except Order.DoesNotExist:
-                    return None
-            
-            order = await sync_to_async(_get_order)()
+            # Confirm the order and read what the message needs (one thread hop)
+            order = await _confirm_order(order_id)
             
             if not order:
                 await query.answer("❌ Заказ не найден")
                 return
             
-            # Update order status to confirmed (sync -> async)
-            def _update_order():
-                from orders.models import Order
-                order.status = Order.STATUS_CONFIRMED
-                order.save()
-            
-            await sync_to_async(_update_order)()
+            full_name, total = order
             
             # Update message text
-            await query.edit_message_text(
-                text=f"✅ <b>ЗАКАЗ #{order_id} УСПЕШНО ЗАКРЫТ</b>\n\n"
-                     f"Статус: <b>Подтвержден</b>\n"
-                     f"Клиент: {order.full_name}\n"
-                     f"Сумма: {float(order.total):,.0f} UZS",
-                parse_mode='HTML'
+            await WebhookService._finish_order_message(
+                query,
+                order_id,
+                f"✅ <b>ЗАКАЗ #{order_id} УСПЕШНО ЗАКРЫТ</b>\n\n"
+                f"Статус: <b>Подтвержден</b>\n"
+                f"Клиент: {_escape(full_name)}\n"
+                f"Сумма: {float(total):,.0f} UZS"
             )
             
             try:
@@ -325,36 +429,25 @@ class WebhookService:
         Handle order cancellation.
         """
         try:
-            # Get order from DB (sync -> async)
-            def _get_order():
-                from orders.models import Order
-                try:
-                    return Order.objects.get(id=order_id)
-                except Order.DoesNotExist:
-                    return None
-            
-            order = await sync_to_async(_get_order)()
+            # Read what the message needs and delete the order completely
+            # from DB (one thread hop)
+            order = await _delete_order(order_id)
             
             if not order:
                 await query.answer("❌ Заказ не найден")
                 return
             
-            # Store order info before deletion
-            order_info = f"Заказ #{order_id}\nКлиент: {order.full_name}\nСумма: {float(order.total):,.0f} UZS"
-            
-            # Delete order completely from DB (sync -> async)
-            def _delete_order():
-                from orders.models import Order
-                Order.objects.filter(id=order_id).delete()
-            
-            await sync_to_async(_delete_order)()
+            # Order info for the message (the row is gone now)
+            full_name, total = order
+            order_info = f"Заказ #{order_id}\nКлиент: {_escape(full_name)}\nСумма: {float(total):,.0f} UZS"
             
             # Update message text
-            await query.edit_message_text(
-                text=f"❌ <b>ЗАКАЗ ОТМЕНЕН И УДАЛЕН</b>\n\n"
-                     f"{order_info}\n\n"
-                     f"⚠️ Заказ полностью удален из базы данных",
-                parse_mode='HTML'
+            await WebhookService._finish_order_message(
+                query,
+                order_id,
+                f"❌ <b>ЗАКАЗ ОТМЕНЕН И УДАЛЕН</b>\n\n"
+                f"{order_info}\n\n"
+                f"⚠️ Заказ полностью удален из базы данных"
             )
             
             await query.answer("❌ Заказ отменен и удален!")
@@ -363,3 +456,9 @@ class WebhookService:
             logger.error(f'Error handling order cancellation for #{order_id}: {e}')
             await query.answer("❌ Ошибка при отмене заказа")
 
+
+# Callback action -> handler(query, order_id), see parse_callback_data()
+CALLBACK_HANDLERS = {
+    ORDER_SUCCESS_CALLBACK: WebhookService._handle_order_success,
+    ORDER_CANCEL_CALLBACK: WebhookService._handle_order_cancel,
+}
@@ -3,10 +3,10 @@ Unit tests for Telegram Bot services.
 """
 import pytest
 from unittest.mock import Mock, patch, AsyncMock
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from decimal import Decimal
 
-from telegram.error import TelegramError
+from telegram.error import RetryAfter, TelegramError
 
 from orders.models import Order
 from telegram_bot.models import BotConfig, GroupNotification
@@ -22,14 +22,25 @@ from telegram_bot.exceptions import (
 class TestTelegramService(TestCase):
     """Tests for TelegramService."""
     
-    def setUp(self):
-        """Setup test data."""
-        self.bot_config = BotConfig.objects.create(
+    @classmethod
+    def setUpTestData(cls):
+        """Setup test data (once per class; each test rolls back to it)."""
+        cls.bot_config = BotConfig.objects.create(
             bot_token='123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11',
             notification_group_id='-1001234567890',
             is_active=True
         )
     
+    def setUp(self):
+        """Start each test with an empty config cache and no rate-limit waits."""
+        TelegramService.clear_config_cache()
+        
+        # Rate limiter slots are granted at once,
+        # so send tests don't sleep in wall-clock time
+        patcher = patch('telegram_bot.services.telegram._RateLimiter.acquire', new=AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
     def test_get_bot_config_success(self):
         """Test getting bot config successfully."""
         config = TelegramService.get_bot_config()
@@ -51,10 +62,87 @@ class TestTelegramService(TestCase):
         with pytest.raises(BotInactiveError):
             TelegramService.get_bot_config()
     
+    def test_get_bot_config_async_cached(self):
+        """Test async config lookup is served from cache after first load."""
+        from asgiref.sync import async_to_sync
+        
+        async_to_sync(TelegramService.get_bot_config_async)()
+        
+        with self.assertNumQueries(0):
+            config = async_to_sync(TelegramService.get_bot_config_async)()
+        assert config == self.bot_config
+    
+    def test_get_bot_config_async_cache_invalidated_on_save(self):
+        """Test saving config clears the cached config."""
+        from asgiref.sync import async_to_sync
+        
+        async_to_sync(TelegramService.get_bot_config_async)()
+        
+        self.bot_config.is_active = False
+        self.bot_config.save()
+        
+        with pytest.raises(BotInactiveError):
+            async_to_sync(TelegramService.get_bot_config_async)()
+    
+    def test_get_bot_config_cached(self):
+        """Test sync config lookup is served from cache after first load."""
+        TelegramService.get_bot_config()
+        
+        with self.assertNumQueries(0):
+            config = TelegramService.get_bot_config()
+        assert config == self.bot_config
+    
+    def test_update_webhook_url(self):
+        """Test webhook URL is written with one query and the cache is dropped."""
+        TelegramService.get_bot_config()
+        
+        with self.assertNumQueries(1):
+            assert TelegramService.update_webhook_url('https://example.com/telegram/webhook/') is True
+        
+        assert TelegramService.get_bot_config().webhook_url == 'https://example.com/telegram/webhook/'
+    
     def test_get_bot(self):
         """Test getting Bot instance."""
         bot = TelegramService.get_bot()
         assert bot.token == self.bot_config.bot_token
+        assert TelegramService.get_bot() is bot
+    
+    def test_get_bot_reuses_instance(self):
+        """Test Bot instances are shared per token within one event loop."""
+        from asgiref.sync import async_to_sync
+        token = self.bot_config.bot_token
+        
+        assert TelegramService.get_bot() is TelegramService.get_cached_bot(token)
+        
+        # A running event loop gets its own Bot (connection pools are loop-bound)
+        async def _get():
+            return TelegramService.get_cached_bot(token), TelegramService.get_cached_bot(token)
+        
+        first, second = async_to_sync(_get)()
+        assert first is second
+        assert first is not TelegramService.get_bot()
+    
+    def test_get_cached_bot_evicts_stale_entries(self):
+        """Test a replaced token's pool is closed and Bots of closed loops are dropped."""
+        import asyncio
+        from telegram_bot.services import telegram
+        
+        async def _get(token):
+            return TelegramService.get_cached_bot(token)
+        
+        loop = asyncio.new_event_loop()
+        try:
+            old = loop.run_until_complete(_get('111:OLD'))
+            with patch.object(old.request, 'shutdown', new=AsyncMock()) as shutdown:
+                loop.run_until_complete(_get('222:NEW'))
+                loop.run_until_complete(asyncio.sleep(0))
+            shutdown.assert_awaited_once()
+        finally:
+            loop.close()
+        
+        asyncio.run(_get('222:NEW'))
+        assert ('111:OLD', loop) not in telegram._bot_cache
+        assert ('222:NEW', loop) not in telegram._bot_cache
     
     @pytest.mark.asyncio
     async def test_send_message_success(self):
@@ -89,15 +177,33 @@ class TestTelegramService(TestCase):
                         text='Test message'
                     )
 
+    
+    @pytest.mark.asyncio
+    async def test_send_message_raises_flood_control(self):
+        """Test flood control is raised at once (the worker owns retries)."""
+        mock_bot = Mock()
+        mock_bot.send_message = AsyncMock(side_effect=RetryAfter(30))
+        
+        with patch.object(TelegramService, 'get_cached_bot', return_value=mock_bot):
+            with TelegramService.use_config(self.bot_config):
+                with pytest.raises(RetryAfter):
+                    await TelegramService.send_message(
+                        chat_id='-1009999999999',
+                        text='Test message'
+                    )
+        
+        assert mock_bot.send_message.await_count == 1
+
 
 @pytest.mark.django_db
 class TestNotificationService(TestCase):
     """Tests for NotificationService."""
     
-    def setUp(self):
-        """Setup test data."""
+    @classmethod
+    def setUpTestData(cls):
+        """Setup test data (once per class; each test rolls back to it)."""
         # Create bot config
-        self.bot_config = BotConfig.objects.create(
+        cls.bot_config = BotConfig.objects.create(
             bot_token='123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11',
             notification_group_id='-1001234567890',
             is_active=True
@@ -121,7 +227,7 @@ class TestNotificationService(TestCase):
             category=category
         )
         
-        self.order = Order.objects.create(
+        cls.order = Order.objects.create(
             full_name='Test User',
             phone_number='+998901234567',
             telegram_username='testuser',
@@ -131,24 +237,43 @@ class TestNotificationService(TestCase):
             total=Decimal('200.00')
         )
         
-        OrderItem.objects.create(
-            order=self.order,
-            product=product,
-            quantity=2,
-            price_snapshot=Decimal('100.00')
-        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=cls.order,
+                product=product,
+                name_snapshot=product.name,
+                price_snapshot=Decimal('100.00'),
+                qty=2,
+                line_total=Decimal('200.00')
+            )
+        ])
+    
+    def setUp(self):
+        """Start each test with an empty config cache."""
+        TelegramService.clear_config_cache()
     
     def test_format_order_message(self):
         """Test formatting order message."""
         message = NotificationService.format_order_message(self.order)
         
-        assert f'НОВЫЙ ЗАКАЗ #{self.order.id}' in message
+        assert f'NEW ORDER #{self.order.id}' in message
         assert 'Test User' in message
         assert '+998901234567' in message
         assert '@testuser' in message
         assert 'Test Product' in message
         assert '200' in message  # Total
     
+    def test_format_order_message_escapes_html(self):
+        """Test user-entered fields are HTML-escaped."""
+        self.order.full_name = '<b>Evil</b> & Co'
+        self.order.comment = '<a href="x">click</a>'
+        
+        message = NotificationService.format_order_message(self.order)
+        
+        assert '&lt;b&gt;Evil&lt;/b&gt; &amp; Co' in message
+        assert '&lt;a href="x"&gt;click&lt;/a&gt;' in message
+        assert '<a href="x">' not in message
+    
     @pytest.mark.asyncio
     async def test_send_order_notification_success(self):
         """Test sending order notification successfully."""
@@ -167,17 +292,203 @@ class TestNotificationService(TestCase):
                 await NotificationService.send_order_notification(self.order)
             
             # Check notification was saved with error
-            notification = GroupNotification.objects.get(order=self.order)
+            notification = await GroupNotification.objects.aget(order=self.order)
             assert notification.status == GroupNotification.STATUS_FAILED
             assert 'Test error' in notification.error_message
     
     def test_send_order_notification_sync(self):
         """Test synchronous wrapper for sending notification."""
-        with patch.object(NotificationService, 'send_order_notification', new=AsyncMock(return_value=Mock())):
-            with patch('asyncio.get_event_loop') as mock_loop:
-                mock_loop.return_value.run_until_complete.return_value = Mock()
-                
-                result = NotificationService.send_order_notification_sync(self.order)
-                assert result is not None
+        notification = Mock()
+        with patch.object(NotificationService, 'send_order_notification', new=AsyncMock(return_value=notification)):
+            result = NotificationService.send_order_notification_sync(self.order)
+            assert result is notification
 
 
+@pytest.mark.django_db
+class TestGroupedNotification(TestCase):
+    """Tests for grouped (coalesced) order notifications."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Setup test data (once per class; each test rolls back to it)."""
+        cls.bot_config = BotConfig.objects.create(
+            bot_token='123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11',
+            notification_group_id='-1001234567890',
+            is_active=True
+        )
+        
+        with patch('telegram_bot.worker.submit'):
+            cls.orders = [
+                Order.objects.create(
+                    full_name=f'User {i}',
+                    phone_number='+998901234567',
+                    payment_method='cash',
+                    subtotal=Decimal('100.00'),
+                    discount_total=Decimal('0.00'),
+                    total=Decimal('100.00')
+                )
+                for i in range(3)
+            ]
+    
+    def setUp(self):
+        """Start each test with an empty config cache."""
+        TelegramService.clear_config_cache()
+    
+    def test_format_orders_message(self):
+        """Test grouped message lists every order."""
+        message = NotificationService.format_orders_message(self.orders)
+        
+        assert '3 NEW ORDERS' in message
+        for order in self.orders:
+            assert f'#{order.id}' in message
+    
+    def test_send_orders_notification(self):
+        """Test one message is sent and every order gets a notification record."""
+        from asgiref.sync import async_to_sync
+        
+        send = AsyncMock(return_value=12345)
+        with patch.object(TelegramService, 'send_message', new=send):
+            async_to_sync(NotificationService.send_orders_notification)(self.orders)
+        
+        send.assert_awaited_once()
+        keyboard = send.await_args.kwargs['reply_markup'].inline_keyboard
+        assert len(keyboard) == len(self.orders)
+        
+        notifications = GroupNotification.objects.filter(order__in=self.orders)
+        assert notifications.count() == len(self.orders)
+        assert set(notifications.values_list('status', 'message_id')) == {
+            (GroupNotification.STATUS_SENT, '12345')
+        }
+    
+    def test_order_buttons_callback_data(self):
+        """Test order buttons use short callback data that parses back."""
+        from telegram_bot.services.notification import _order_buttons, parse_callback_data
+        
+        success, cancel = _order_buttons(42, 'ok', 'cancel')
+        
+        assert success.callback_data == 'os:42'
+        assert cancel.callback_data == 'oc:42'
+        assert parse_callback_data(success.callback_data) == ('os', '42')
+        # Buttons of messages sent before the short format still work
+        assert parse_callback_data('order_cancel_42') == ('oc', '42')
+        assert parse_callback_data('unknown') == ('unknown', '')
+
+
+def _callback_query(order_ids, text=''):
+    """Build a mock callback query on a message with a button row per order."""
+    from telegram import InlineKeyboardMarkup
+    from telegram_bot.services.notification import _order_buttons
+    
+    query = Mock()
+    query.answer = AsyncMock()
+    query.edit_message_text = AsyncMock()
+    query.edit_message_reply_markup = AsyncMock()
+    query.message.text = text
+    query.message.reply_text = AsyncMock()
+    query.message.reply_markup = InlineKeyboardMarkup([
+        _order_buttons(order_id, 'ok', 'cancel') for order_id in order_ids
+    ])
+    return query
+
+
+class TestWebhookCallbacks(TestCase):
+    """Tests for order button callbacks on notification messages."""
+    
+    def test_finish_single_order_message(self):
+        """Test a single-order message is replaced, whatever its text says."""
+        from asgiref.sync import async_to_sync
+        from telegram_bot.services.webhook import WebhookService
+        
+        query = _callback_query([1], text='Client: 3 NEW ORDERS Ltd')
+        async_to_sync(WebhookService._finish_order_message)(query, '1', 'done')
+        
+        query.edit_message_text.assert_awaited_once_with(text='done', parse_mode='HTML')
+        query.edit_message_reply_markup.assert_not_awaited()
+    
+    def test_finish_grouped_order_message(self):
+        """Test only the order's row is removed from a grouped message."""
+        from asgiref.sync import async_to_sync
+        from telegram_bot.services.notification import parse_callback_data
+        from telegram_bot.services.webhook import WebhookService
+        
+        query = _callback_query([1, 2, 3])
+        async_to_sync(WebhookService._finish_order_message)(query, '2', 'done')
+        
+        query.edit_message_text.assert_not_awaited()
+        rows = query.edit_message_reply_markup.await_args.kwargs['reply_markup'].inline_keyboard
+        assert [parse_callback_data(row[0].callback_data)[1] for row in rows] == ['1', '3']
+        query.message.reply_text.assert_awaited_once_with('done', parse_mode='HTML')
+    
+    def test_order_success_escapes_customer_name(self):
+        """Test the customer name is HTML-escaped in the result message."""
+        from asgiref.sync import async_to_sync
+        from telegram_bot.services.webhook import WebhookService
+        
+        query = _callback_query([1])
+        confirm = AsyncMock(return_value=('<b & Co', Decimal('100.00')))
+        with patch('telegram_bot.services.webhook._confirm_order', new=confirm):
+            async_to_sync(WebhookService._handle_order_success)(query, '1')
+        
+        text = query.edit_message_text.await_args.kwargs['text']
+        assert 'Клиент: &lt;b &amp; Co\n' in text
+
+
+class TestOrderCallbacks(TransactionTestCase):
+    """
+    Tests for the close/cancel order callbacks against the database.
+    
+    The handlers do their DB work on a pool thread (thread_sensitive=False),
+    which only sees committed rows, hence TransactionTestCase.
+    """
+    
+    def setUp(self):
+        """Setup test data."""
+        with patch('telegram_bot.worker.submit'):
+            self.order = Order.objects.create(
+                full_name='Test User',
+                phone_number='+998901234567',
+                payment_method='cash',
+                subtotal=Decimal('100.00'),
+                discount_total=Decimal('0.00'),
+                total=Decimal('100.00')
+            )
+    
+    def test_order_success_confirms_order(self):
+        """Test closing an order as successful confirms it."""
+        from asgiref.sync import async_to_sync
+        from telegram_bot.services.webhook import WebhookService
+        
+        query = _callback_query([self.order.id])
+        async_to_sync(WebhookService._handle_order_success)(query, str(self.order.id))
+        
+        self.order.refresh_from_db()
+        assert self.order.status == Order.STATUS_CONFIRMED
+        assert 'Test User' in query.edit_message_text.await_args.kwargs['text']
+        query.answer.assert_awaited_once_with("✅ Заказ успешно закрыт!")
+    
+    def test_order_cancel_deletes_order(self):
+        """Test cancelling an order deletes it."""
+        from asgiref.sync import async_to_sync
+        from telegram_bot.services.webhook import WebhookService
+        
+        query = _callback_query([self.order.id])
+        async_to_sync(WebhookService._handle_order_cancel)(query, str(self.order.id))
+        
+        assert not Order.objects.filter(id=self.order.id).exists()
+        assert 'Test User' in query.edit_message_text.await_args.kwargs['text']
+        query.answer.assert_awaited_once_with("❌ Заказ отменен и удален!")
+    
+    def test_missing_order(self):
+        """Test both callbacks report a missing order and leave the message alone."""
+        from asgiref.sync import async_to_sync
+        from telegram_bot.services.webhook import WebhookService
+        
+        missing_id = str(self.order.id + 1000)
+        for handler in (WebhookService._handle_order_success, WebhookService._handle_order_cancel):
+            query = _callback_query([missing_id])
+            async_to_sync(handler)(query, missing_id)
+            
+            query.answer.assert_awaited_once_with("❌ Заказ не найден")
+            query.edit_message_text.assert_not_awaited()
+        
+        assert Order.objects.filter(id=self.order.id).exists()
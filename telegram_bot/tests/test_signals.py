@@ -2,7 +2,7 @@
 Tests for Telegram Bot signals.
 """
 import pytest
-from unittest.mock import patch, Mock
+from unittest.mock import patch, Mock, AsyncMock
 from django.test import TestCase
 from decimal import Decimal
 
@@ -15,10 +15,11 @@ from telegram_bot.exceptions import NotificationFailedError
 class TestOrderSignals(TestCase):
     """Tests for order creation signals."""
     
-    def setUp(self):
-        """Setup test data."""
+    @classmethod
+    def setUpTestData(cls):
+        """Setup test data (once per class; each test rolls back to it)."""
         # Create bot config
-        self.bot_config = BotConfig.objects.create(
+        cls.bot_config = BotConfig.objects.create(
             bot_token='123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11',
             notification_group_id='-1001234567890',
             is_active=True
@@ -32,7 +33,7 @@ class TestOrderSignals(TestCase):
             slug='test-category'
         )
         
-        self.product = Product.objects.create(
+        cls.product = Product.objects.create(
             name='Test Product',
             slug='test-product',
             description='Test description',
@@ -41,29 +42,29 @@ class TestOrderSignals(TestCase):
             category=category
         )
     
-    @patch('telegram_bot.services.notification.NotificationService.send_order_notification_sync')
-    def test_order_creation_sends_notification(self, mock_send):
+    def setUp(self):
+        """Patch the worker once for every test, so no test reaches real dispatch."""
+        patcher = patch('telegram_bot.worker.submit', return_value=True)
+        self.mock_submit = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_order_creation_sends_notification(self):
         """Test that creating order sends notification."""
-        mock_notification = Mock()
-        mock_notification.message_id = '12345'
-        mock_notification.status = GroupNotification.STATUS_SENT
-        mock_send.return_value = mock_notification
-        
         # Create order
-        order = Order.objects.create(
-            full_name='Test User',
-            phone_number='+998901234567',
-            payment_method='cash',
-            subtotal=Decimal('100.00'),
-            discount_total=Decimal('0.00'),
-            total=Decimal('100.00')
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                full_name='Test User',
+                phone_number='+998901234567',
+                payment_method='cash',
+                subtotal=Decimal('100.00'),
+                discount_total=Decimal('0.00'),
+                total=Decimal('100.00')
+            )
         
-        # Check notification was sent
-        mock_send.assert_called_once_with(order)
+        # Check notification was queued after commit
+        self.mock_submit.assert_called_once_with(order.id)
     
-    @patch('telegram_bot.services.notification.NotificationService.send_order_notification_sync')
-    def test_order_update_does_not_send_notification(self, mock_send):
+    def test_order_update_does_not_send_notification(self):
         """Test that updating order does not send notification."""
         # Create order
         order = Order.objects.create(
@@ -75,56 +76,238 @@ class TestOrderSignals(TestCase):
             total=Decimal('100.00')
         )
         
-        mock_send.reset_mock()
+        self.mock_submit.reset_mock()
         
         # Update order
-        order.status = Order.STATUS_DELIVERED
-        order.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = Order.STATUS_CONFIRMED
+            order.save()
         
         # Check notification was NOT sent
-        mock_send.assert_not_called()
+        self.mock_submit.assert_not_called()
     
-    @patch('telegram_bot.services.notification.NotificationService.send_order_notification_sync')
-    def test_notification_failure_does_not_break_order_creation(self, mock_send):
+    def test_notification_failure_does_not_break_order_creation(self):
         """Test that notification failure doesn't prevent order creation."""
-        mock_send.side_effect = NotificationFailedError('Test error')
+        self.mock_submit.side_effect = NotificationFailedError('Test error')
         
         # Create order - should not raise exception
-        order = Order.objects.create(
-            full_name='Test User',
-            phone_number='+998901234567',
-            payment_method='cash',
-            subtotal=Decimal('100.00'),
-            discount_total=Decimal('0.00'),
-            total=Decimal('100.00')
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                full_name='Test User',
+                phone_number='+998901234567',
+                payment_method='cash',
+                subtotal=Decimal('100.00'),
+                discount_total=Decimal('0.00'),
+                total=Decimal('100.00')
+            )
         
-        # Order should be created successfully
-        assert order.id is not None
+        # The failing submit ran, and the order was still created
+        self.mock_submit.assert_called_once_with(order.id)
         assert Order.objects.filter(id=order.id).exists()
     
-    @patch('telegram_bot.services.notification.NotificationService.send_order_notification_sync')
-    def test_bot_inactive_does_not_break_order_creation(self, mock_send):
+    def test_bot_inactive_does_not_break_order_creation(self):
         """Test that inactive bot doesn't prevent order creation."""
         # Make bot inactive
         self.bot_config.is_active = False
         self.bot_config.save()
         
         from telegram_bot.exceptions import BotInactiveError
-        mock_send.side_effect = BotInactiveError()
+        self.mock_submit.side_effect = BotInactiveError()
         
         # Create order - should not raise exception
-        order = Order.objects.create(
-            full_name='Test User',
-            phone_number='+998901234567',
-            payment_method='cash',
-            subtotal=Decimal('100.00'),
-            discount_total=Decimal('0.00'),
-            total=Decimal('100.00')
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                full_name='Test User',
+                phone_number='+998901234567',
+                payment_method='cash',
+                subtotal=Decimal('100.00'),
+                discount_total=Decimal('0.00'),
+                total=Decimal('100.00')
+            )
         
-        # Order should be created successfully
-        assert order.id is not None
+        # The failing submit ran, and the order was still created
+        self.mock_submit.assert_called_once_with(order.id)
         assert Order.objects.filter(id=order.id).exists()
 
 
+class TestNotificationWorker(TestCase):
+    """Tests for the background notification worker."""
+    
+    @patch('telegram_bot.worker.MAX_PENDING_NOTIFICATIONS', 0)
+    def test_submit_drops_when_full(self):
+        """Test notifications are dropped instead of queued past the limit."""
+        from telegram_bot import worker
+        
+        assert worker.submit(1) is False
+    
+    def test_transient_failure_is_retried(self):
+        """Test network failures are queued again with backoff."""
+        from telegram.error import NetworkError, BadRequest
+        from telegram_bot import worker
+        
+        loop = Mock()
+        with patch('asyncio.get_running_loop', return_value=loop), \
+                patch.object(worker, '_pending_count', 0):
+            error = NotificationFailedError('timed out')
+            error.__cause__ = NetworkError('timed out')
+            assert worker._retry_later([7], 1, error) is True
+            assert worker._pending_count == 1
+            loop.call_later.assert_called_once_with(
+                worker.RETRY_BACKOFF * 2, worker._enqueue_retry, [7], 2
+            )
+            
+            error.__cause__ = BadRequest('chat not found')
+            assert worker._retry_later([7], 0, error) is False
+            
+            error.__cause__ = NetworkError('timed out')
+            assert worker._retry_later([7], worker.NOTIFICATION_MAX_RETRIES, error) is False
+    
+    def test_flood_control_waits_retry_after(self):
+        """Test a 429 is rescheduled no sooner than Telegram's retry_after."""
+        from telegram.error import RetryAfter
+        from telegram_bot import worker
+        
+        loop = Mock()
+        with patch('asyncio.get_running_loop', return_value=loop), \
+                patch.object(worker, '_pending_count', 0):
+            error = NotificationFailedError('flood control')
+            error.__cause__ = RetryAfter(30)
+            assert worker._retry_later([7], 0, error) is True
+            loop.call_later.assert_called_once_with(30, worker._enqueue_retry, [7], 1)
+    
+    def test_flush_loop_coalesces_burst(self):
+        """Test the first order is sent at once and a burst goes out as one batch."""
+        import asyncio
+        from telegram_bot import worker
+        
+        batches = []
+        
+        async def send(order_ids, attempt=0):
+            batches.append(list(order_ids))
+        
+        async def scenario():
+            worker._enqueue(1)
+            await asyncio.sleep(0.01)
+            for order_id in (2, 3, 4):
+                worker._enqueue(order_id)
+            await asyncio.sleep(0.1)
+            worker._flusher.cancel()
+        
+        with patch.object(worker, '_send_notifications', new=send), \
+                patch.object(worker, 'GROUP_MESSAGE_INTERVAL', 0.05), \
+                patch.object(worker, '_buffer', []), \
+                patch.object(worker, '_retries', []), \
+                patch.object(worker, '_buffer_ready', None), \
+                patch.object(worker, '_flusher', None), \
+                patch.object(worker, '_pending_count', 4):
+            asyncio.run(scenario())
+            assert worker._pending_count == 0
+        
+        assert batches == [[1], [2, 3, 4]]
+    
+    def test_flush_loop_keeps_retry_batches_apart(self):
+        """Test a batch being retried is not merged with new orders."""
+        import asyncio
+        from telegram_bot import worker
+        
+        batches = []
+        
+        async def send(order_ids, attempt=0):
+            batches.append((list(order_ids), attempt))
+        
+        async def scenario():
+            worker._enqueue(5)
+            worker._enqueue_retry([1, 2], 3)
+            await asyncio.sleep(0.1)
+            worker._flusher.cancel()
+        
+        with patch.object(worker, '_send_notifications', new=send), \
+                patch.object(worker, 'GROUP_MESSAGE_INTERVAL', 0.01), \
+                patch.object(worker, '_buffer', []), \
+                patch.object(worker, '_retries', []), \
+                patch.object(worker, '_buffer_ready', None), \
+                patch.object(worker, '_flusher', None), \
+                patch.object(worker, '_pending_count', 3):
+            asyncio.run(scenario())
+        
+        assert batches == [([1, 2], 3), ([5], 0)]
+    
+    def test_retry_then_success_saves_one_record(self):
+        """Test a transient failure followed by a successful retry leaves one SENT record."""
+        import asyncio
+        from asgiref.sync import async_to_sync
+        from telegram.error import NetworkError
+        from telegram_bot import worker
+        from telegram_bot.services import TelegramService
+        
+        BotConfig.objects.create(
+            bot_token='123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11',
+            notification_group_id='-1001234567890',
+            is_active=True
+        )
+        TelegramService.clear_config_cache()
+        with patch('telegram_bot.worker.submit'):
+            order = Order.objects.create(
+                full_name='Test User',
+                phone_number='+998901234567',
+                payment_method='cash',
+                subtotal=Decimal('100.00'),
+                discount_total=Decimal('0.00'),
+                total=Decimal('100.00')
+            )
+        
+        async def scenario():
+            await worker._send_notifications([order.id])
+            assert worker._pending_count == 1  # queued again
+            for _ in range(100):
+                if worker._pending_count == 0:
+                    break
+                await asyncio.sleep(0.01)
+            worker._flusher.cancel()
+        
+        send = AsyncMock(side_effect=[NetworkError('timed out'), 12345])
+        with patch.object(TelegramService, 'send_message', new=send), \
+                patch('telegram_bot.worker.close_old_connections'), \
+                patch.object(worker, 'RETRY_BACKOFF', 0), \
+                patch.object(worker, '_buffer', []), \
+                patch.object(worker, '_retries', []), \
+                patch.object(worker, '_buffer_ready', None), \
+                patch.object(worker, '_flusher', None), \
+                patch.object(worker, '_pending_count', 0):
+            async_to_sync(scenario)()
+        
+        assert send.await_count == 2
+        notifications = GroupNotification.objects.filter(order=order)
+        assert list(notifications.values_list('status', flat=True)) == [GroupNotification.STATUS_SENT]
+    
+    def test_inactive_bot_records_nothing(self):
+        """Test an inactive bot skips the notification without a FAILED record or retry."""
+        from asgiref.sync import async_to_sync
+        from telegram_bot import worker
+        from telegram_bot.services import TelegramService
+        
+        BotConfig.objects.create(
+            bot_token='123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11',
+            notification_group_id='-1001234567890',
+            is_active=False
+        )
+        TelegramService.clear_config_cache()
+        with patch('telegram_bot.worker.submit'):
+            order = Order.objects.create(
+                full_name='Test User',
+                phone_number='+998901234567',
+                payment_method='cash',
+                subtotal=Decimal('100.00'),
+                discount_total=Decimal('0.00'),
+                total=Decimal('100.00')
+            )
+        
+        send = AsyncMock()
+        with patch.object(TelegramService, 'send_message', new=send), \
+                patch('telegram_bot.worker.close_old_connections'), \
+                patch.object(worker, '_retry_later') as retry_later:
+            async_to_sync(worker._send_notifications)([order.id])
+        
+        send.assert_not_awaited()
+        retry_later.assert_not_called()
+        assert not GroupNotification.objects.filter(order=order).exists()
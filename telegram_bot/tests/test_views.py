@@ -3,65 +3,60 @@ Integration tests for Telegram Bot views.
 """
 import pytest
 import json
-from unittest.mock import patch, AsyncMock, Mock
-from django.test import TestCase, Client
+from unittest.mock import patch, AsyncMock
+from django.test import TestCase, TransactionTestCase
 from django.urls import reverse
 
 from telegram_bot.models import BotConfig
+from telegram_bot.exceptions import BotInactiveError
 
 
 @pytest.mark.django_db
 class TestWebhookView(TestCase):
     """Tests for webhook endpoint."""
     
-    def setUp(self):
-        """Setup test data."""
-        self.client = Client()
-        self.bot_config = BotConfig.objects.create(
+    @classmethod
+    def setUpTestData(cls):
+        """Setup test data (once per class; each test rolls back to it)."""
+        cls.bot_config = BotConfig.objects.create(
             bot_token='123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11',
             notification_group_id='-1001234567890',
             webhook_url='https://example.com/telegram/webhook/',
             is_active=True
         )
     
-    @patch('telegram_bot.services.webhook.WebhookService.process_update')
+    @patch('telegram_bot.services.webhook.WebhookService.process_update', new_callable=AsyncMock)
     def test_webhook_success(self, mock_process):
         """Test webhook receiving update successfully."""
-        # Mock async function
-        async def mock_process_update(data):
-            return {'status': 'ok', 'message': 'Update processed'}
-        
-        with patch('asyncio.new_event_loop') as mock_loop:
-            mock_event_loop = Mock()
-            mock_event_loop.run_until_complete.return_value = {'status': 'ok', 'message': 'Update processed'}
-            mock_loop.return_value = mock_event_loop
-            
-            update_data = {
-                'update_id': 123456,
-                'message': {
-                    'message_id': 1,
-                    'from': {
-                        'id': 123,
-                        'first_name': 'Test'
-                    },
-                    'chat': {
-                        'id': 123,
-                        'type': 'private'
-                    },
-                    'date': 1234567890,
-                    'text': '/start'
-                }
+        mock_process.return_value = {'status': 'ok', 'message': 'Update processed'}
+        
+        update_data = {
+            'update_id': 123456,
+            'message': {
+                'message_id': 1,
+                'from': {
+                    'id': 123,
+                    'first_name': 'Test'
+                },
+                'chat': {
+                    'id': 123,
+                    'type': 'private'
+                },
+                'date': 1234567890,
+                'text': '/start'
             }
-            
-            response = self.client.post(
-                '/telegram/webhook/',
-                data=json.dumps(update_data),
-                content_type='application/json'
-            )
-            
-            assert response.status_code == 200
-            data = response.json()
-            assert data['status'] == 'ok'
+        }
+        
+        response = self.client.post(
+            '/telegram/webhook/',
+            data=json.dumps(update_data),
+            content_type='application/json'
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data['status'] == 'ok'
+        mock_process.assert_called_once_with(update_data)
     
     def test_webhook_invalid_data(self):
         """Test webhook with invalid data."""
@@ -72,47 +67,42 @@ class TestWebhookView(TestCase):
         )
         
         assert response.status_code == 500
+        assert response.json() == {'status': 'error', 'message': 'Invalid JSON'}
 
 
 @pytest.mark.django_db
 class TestWebhookManagementViews(TestCase):
     """Tests for webhook management endpoints."""
     
-    def setUp(self):
-        """Setup test data."""
-        self.client = Client()
-        self.bot_config = BotConfig.objects.create(
+    @classmethod
+    def setUpTestData(cls):
+        """Setup test data (once per class; each test rolls back to it)."""
+        cls.bot_config = BotConfig.objects.create(
             bot_token='123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11',
             notification_group_id='-1001234567890',
             is_active=True
         )
     
-    @patch('telegram_bot.services.telegram.TelegramService.set_webhook')
+    @patch('telegram_bot.services.telegram.TelegramService.set_webhook', new_callable=AsyncMock)
     def test_setup_webhook_success(self, mock_set_webhook):
         """Test setting up webhook successfully."""
-        async def mock_set_webhook_async(url):
-            return True
-        
-        with patch('asyncio.new_event_loop') as mock_loop:
-            mock_event_loop = Mock()
-            mock_event_loop.run_until_complete.return_value = True
-            mock_loop.return_value = mock_event_loop
-            
-            response = self.client.post(
-                '/telegram/setup-webhook/',
-                data=json.dumps({
-                    'webhook_url': 'https://example.com/telegram/webhook/'
-                }),
-                content_type='application/json'
-            )
-            
-            assert response.status_code == 200
-            data = response.json()
-            assert data['status'] == 'success'
-            
-            # Check config was updated
-            config = BotConfig.objects.first()
-            assert config.webhook_url == 'https://example.com/telegram/webhook/'
+        mock_set_webhook.return_value = True
+        
+        response = self.client.post(
+            '/telegram/setup-webhook/',
+            data=json.dumps({
+                'webhook_url': 'https://example.com/telegram/webhook/'
+            }),
+            content_type='application/json'
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data['status'] == 'success'
+        
+        # Check config was updated
+        config = BotConfig.objects.first()
+        assert config.webhook_url == 'https://example.com/telegram/webhook/'
     
     def test_setup_webhook_missing_url(self):
         """Test setting up webhook without URL."""
@@ -126,53 +116,89 @@ class TestWebhookManagementViews(TestCase):
         data = response.json()
         assert 'error' in data
     
-    @patch('telegram_bot.services.telegram.TelegramService.get_webhook_info')
+    @patch('telegram_bot.services.telegram.TelegramService.get_webhook_info', new_callable=AsyncMock)
     def test_webhook_info(self, mock_get_info):
         """Test getting webhook info."""
-        async def mock_get_info_async():
-            return {
-                'url': 'https://example.com/telegram/webhook/',
-                'has_custom_certificate': False,
-                'pending_update_count': 0
-            }
+        mock_get_info.return_value = {
+            'url': 'https://example.com/telegram/webhook/',
+            'has_custom_certificate': False,
+            'pending_update_count': 0
+        }
         
-        with patch('asyncio.new_event_loop') as mock_loop:
-            mock_event_loop = Mock()
-            mock_event_loop.run_until_complete.return_value = {
-                'url': 'https://example.com/telegram/webhook/',
-                'has_custom_certificate': False,
-                'pending_update_count': 0
-            }
-            mock_loop.return_value = mock_event_loop
-            
-            response = self.client.get('/telegram/webhook-info/')
-            
-            assert response.status_code == 200
-            data = response.json()
-            assert 'url' in data
+        response = self.client.get('/telegram/webhook-info/')
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert 'url' in data
     
-    @patch('telegram_bot.services.telegram.TelegramService.delete_webhook')
+    @patch('telegram_bot.services.telegram.TelegramService.delete_webhook', new_callable=AsyncMock)
     def test_delete_webhook(self, mock_delete):
         """Test deleting webhook."""
         self.bot_config.webhook_url = 'https://example.com/telegram/webhook/'
         self.bot_config.save()
         
-        async def mock_delete_async():
-            return True
-        
-        with patch('asyncio.new_event_loop') as mock_loop:
-            mock_event_loop = Mock()
-            mock_event_loop.run_until_complete.return_value = True
-            mock_loop.return_value = mock_event_loop
-            
-            response = self.client.post('/telegram/delete-webhook/')
-            
-            assert response.status_code == 200
-            data = response.json()
-            assert data['status'] == 'success'
-            
-            # Check config was updated
-            config = BotConfig.objects.first()
-            assert config.webhook_url is None
+        mock_delete.return_value = True
+        
+        response = self.client.post('/telegram/delete-webhook/')
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data['status'] == 'success'
+        
+        # Check config was updated
+        config = BotConfig.objects.first()
+        assert config.webhook_url is None
+    
+    def test_webhook_info_rejects_post(self):
+        """Test management routes only accept their own HTTP method."""
+        response = self.client.post('/telegram/webhook-info/')
+        
+        assert response.status_code == 405
+    
+    @patch('telegram_bot.services.telegram.TelegramService.delete_webhook', new_callable=AsyncMock)
+    def test_delete_webhook_bot_inactive(self, mock_delete):
+        """Test bot errors are returned as 400."""
+        mock_delete.side_effect = BotInactiveError()
+        
+        response = self.client.post('/telegram/delete-webhook/')
+        
+        assert response.status_code == 400
+        assert response.json() == {'error': str(BotInactiveError())}
 
 
+@pytest.mark.django_db(transaction=True)
+class TestWebhookManagementBotLookup(TransactionTestCase):
+    """Webhook management through the real TelegramService (only Bot API calls mocked)."""
+    
+    def setUp(self):
+        """Create the bot config (committed, so the worker thread sees it) with a cold cache."""
+        from telegram_bot.services import TelegramService
+        
+        BotConfig.objects.create(
+            bot_token='123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11',
+            notification_group_id='-1001234567890',
+            is_active=True
+        )
+        TelegramService.clear_config_cache()
+    
+    @patch('telegram.Bot.delete_webhook', new_callable=AsyncMock, return_value=True)
+    @patch('telegram.Bot.set_webhook', new_callable=AsyncMock, return_value=True)
+    def test_setup_and_delete_webhook_with_cold_cache(self, mock_set, mock_delete):
+        """Test the bot config is loaded inside the worker loop, also after the cache is cleared."""
+        response = self.client.post(
+            '/telegram/setup-webhook/',
+            data=json.dumps({
+                'webhook_url': 'https://example.com/telegram/webhook/'
+            }),
+            content_type='application/json'
+        )
+        
+        assert response.status_code == 200
+        mock_set.assert_awaited_once_with(url='https://example.com/telegram/webhook/')
+        
+        # update_webhook_url() dropped the cached config again
+        response = self.client.post('/telegram/delete-webhook/')
+        
+        assert response.status_code == 200
+        mock_delete.assert_awaited_once()
+        assert BotConfig.objects.get().webhook_url is None
@@ -9,9 +9,21 @@ urlpatterns = [
     path('webhook/', views.webhook, name='telegram-webhook'),
     
     # Webhook management
-    path('setup-webhook/', views.setup_webhook, name='telegram-setup-webhook'),
-    path('webhook-info/', views.webhook_info, name='telegram-webhook-info'),
-    path('delete-webhook/', views.delete_webhook, name='telegram-delete-webhook'),
+    path(
+        'setup-webhook/',
+        views.WebhookManagementView.as_view(action='setup', http_method_names=['post', 'options']),
+        name='telegram-setup-webhook'
+    ),
+    path(
+        'webhook-info/',
+        views.WebhookManagementView.as_view(action='info', http_method_names=['get', 'options']),
+        name='telegram-webhook-info'
+    ),
+    path(
+        'delete-webhook/',
+        views.WebhookManagementView.as_view(action='delete', http_method_names=['post', 'options']),
+        name='telegram-delete-webhook'
+    ),
 ]
 
 
@@ -2,68 +2,98 @@
 Telegram Bot views.
 """
 import logging
-import asyncio
-from django.http import JsonResponse
+import orjson
+from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from rest_framework.decorators import api_view
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework import status
 
+from telegram_bot import worker
 from telegram_bot.services import TelegramService, WebhookService
 from telegram_bot.exceptions import BotNotConfiguredError, BotInactiveError
 
 logger = logging.getLogger(__name__)
 
 
+# Prebuilt body for requests that aren't JSON (e.g. scanners hitting the URL).
+# Only the bytes are shared; middleware may modify the response object.
+_INVALID_JSON_BODY = orjson.dumps({'status': 'error', 'message': 'Invalid JSON'})
+
+# Acknowledgement sent as soon as an update is queued
+_ACCEPTED_BODY = orjson.dumps({'status': 'ok', 'message': 'Update accepted'})
+
+
+def _json_response(data: dict, status_code: int = 200) -> HttpResponse:
+    """Render a JSON body with orjson (bytes in, bytes out)."""
+    return HttpResponse(orjson.dumps(data), status=status_code, content_type='application/json')
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def webhook(request):
+async def webhook(request):
     """
-    Telegram webhook endpoint.
+    Telegram webhook endpoint (async view).
     
-    Receives updates from Telegram and processes them.
+    Receives updates from Telegram and acknowledges them right away; the
+    update is processed in the background on the worker loop, so slow
+    handlers don't hold the response (Telegram retries slow webhooks).
     
     POST /telegram/webhook/
     """
     try:
-        # Get update data from request
-        import json
-        update_data = json.loads(request.body.decode('utf-8'))
+        # Get update data from request (orjson parses the raw bytes)
+        update_data = orjson.loads(request.body)
         
         logger.info(f'Received webhook update: {update_data.get("update_id")}')
         
-        # Process update asynchronously
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            WebhookService.process_update(update_data)
-        )
-        loop.close()
+        # Process update in the background and ACK immediately
+        worker.spawn(WebhookService.process_update(update_data))
+        
+        return HttpResponse(_ACCEPTED_BODY, content_type='application/json')
         
-        return JsonResponse(result)
+    except orjson.JSONDecodeError:
+        logger.warning('Webhook received invalid JSON')
+        return HttpResponse(_INVALID_JSON_BODY, status=500, content_type='application/json')
         
     except Exception as e:
         logger.error(f'Webhook error: {e}')
-        return JsonResponse(
+        return _json_response(
             {'status': 'error', 'message': str(e)},
-            status=500
+            status_code=500
         )
 
 
-@api_view(['POST'])
-def setup_webhook(request):
+class WebhookManagementView(APIView):
     """
-    Setup webhook for Telegram bot.
+    Webhook management endpoints (one view, routed per action).
     
-    POST /telegram/setup-webhook/
+    POST /telegram/setup-webhook/   (action='setup')
+    GET  /telegram/webhook-info/    (action='info')
+    POST /telegram/delete-webhook/  (action='delete')
     
-    Request body:
-    {
-        "webhook_url": "https://your-domain.com/telegram/webhook/"
-    }
+    Each route is built once with as_view(action=..., http_method_names=...),
+    and bot errors are mapped to responses in handle_exception.
     """
-    try:
+    action = None
+    
+    def get(self, request):
+        return self._handlers[self.action](self, request)
+    
+    def post(self, request):
+        return self._handlers[self.action](self, request)
+    
+    def setup_webhook(self, request):
+        """
+        Setup webhook for Telegram bot.
+        
+        Request body:
+        {
+            "webhook_url": "https://your-domain.com/telegram/webhook/"
+        }
+        """
         webhook_url = request.data.get('webhook_url')
         
         if not webhook_url:
@@ -73,116 +103,63 @@ def setup_webhook(request):
             )
         
         # Setup webhook
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            TelegramService.set_webhook(webhook_url)
-        )
-        loop.close()
+        result = worker.run(TelegramService.set_webhook(webhook_url))
         
-        if result:
-            # Update config
-            from telegram_bot.models import BotConfig
-            config = BotConfig.objects.first()
-            if config:
-                config.webhook_url = webhook_url
-                config.save()
-            
-            return Response({
-                'status': 'success',
-                'message': f'Webhook set to {webhook_url}',
-                'webhook_url': webhook_url
-            })
-        else:
+        if not result:
             return Response(
                 {'error': 'Failed to set webhook'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
         
-    except (BotNotConfiguredError, BotInactiveError) as e:
-        return Response(
-            {'error': str(e)},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    except Exception as e:
-        logger.error(f'Setup webhook error: {e}')
-        return Response(
-            {'error': str(e)},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
-
-
-@api_view(['GET'])
-def webhook_info(request):
-    """
-    Get webhook information.
-    
-    GET /telegram/webhook-info/
-    """
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        info = loop.run_until_complete(
-            TelegramService.get_webhook_info()
-        )
-        loop.close()
-        
-        return Response(info)
+        # Update config
+        TelegramService.update_webhook_url(webhook_url)
         
-    except (BotNotConfiguredError, BotInactiveError) as e:
-        return Response(
-            {'error': str(e)},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    except Exception as e:
-        logger.error(f'Get webhook info error: {e}')
-        return Response(
-            {'error': str(e)},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
-
-
-@api_view(['POST'])
-def delete_webhook(request):
-    """
-    Delete webhook.
+        return Response({
+            'status': 'success',
+            'message': f'Webhook set to {webhook_url}',
+            'webhook_url': webhook_url
+        })
     
-    POST /telegram/delete-webhook/
-    """
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            TelegramService.delete_webhook()
-        )
-        loop.close()
+    def webhook_info(self, request):
+        """Get webhook information."""
+        return Response(worker.run(TelegramService.get_webhook_info()))
+    
+    def delete_webhook(self, request):
+        """Delete webhook."""
+        result = worker.run(TelegramService.delete_webhook())
         
-        if result:
-            # Update config
-            from telegram_bot.models import BotConfig
-            config = BotConfig.objects.first()
-            if config:
-                config.webhook_url = None
-                config.save()
-            
-            return Response({
-                'status': 'success',
-                'message': 'Webhook deleted'
-            })
-        else:
+        if not result:
             return Response(
                 {'error': 'Failed to delete webhook'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
         
-    except (BotNotConfiguredError, BotInactiveError) as e:
-        return Response(
-            {'error': str(e)},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    except Exception as e:
-        logger.error(f'Delete webhook error: {e}')
+        # Update config
+        TelegramService.update_webhook_url(None)
+        
+        return Response({
+            'status': 'success',
+            'message': 'Webhook deleted'
+        })
+    
+    _handlers = {
+        'setup': setup_webhook,
+        'info': webhook_info,
+        'delete': delete_webhook,
+    }
+    
+    def handle_exception(self, exc):
+        """Map bot errors to 400 and unexpected errors to 500."""
+        if isinstance(exc, (BotNotConfiguredError, BotInactiveError)):
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if isinstance(exc, APIException):
+            return super().handle_exception(exc)
+        
+        logger.error(f'Webhook management error ({self.action}): {exc}')
         return Response(
-            {'error': str(e)},
+            {'error': str(exc)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
@@ -0,0 +1,325 @@
+"""
+Telegram Bot background worker.
+
+One daemon thread owns a long-lived asyncio event loop that sends order
+notifications, so bursts of orders reuse the same loop and Bot connection
+pool instead of spawning a thread and an event loop per order.
+
+Telegram allows about 20 messages per minute in a group, so at most one
+notification message is sent every GROUP_MESSAGE_INTERVAL seconds. Orders
+that arrive in between are coalesced into one grouped message.
+
+Sends that fail on network errors or flood control are queued again as the
+same batch with exponential backoff, up to NOTIFICATION_MAX_RETRIES times.
+A FAILED notification record is only written once retries run out.
+"""
+import asyncio
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from telegram_bot.exceptions import BotNotConfiguredError, BotInactiveError, NotificationFailedError
+
+logger = logging.getLogger(__name__)
+
+# Max orders queued or being sent; new ones are dropped (and logged) past this
+MAX_PENDING_NOTIFICATIONS = 100
+
+# Seconds to wait for queued notifications when the process exits
+SHUTDOWN_TIMEOUT = 10
+
+# Minimum seconds between messages to the group (~20 messages/minute)
+GROUP_MESSAGE_INTERVAL = 3.0
+
+# Max orders coalesced into one grouped message
+COALESCE_MAX_ORDERS = 10
+
+# Retries for transient send failures; the delay doubles from RETRY_BACKOFF seconds
+NOTIFICATION_MAX_RETRIES = 5
+RETRY_BACKOFF = 2.0
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+_idle = threading.Condition(_lock)
+_pending_count = 0
+
+# Owned by the worker loop thread
+_buffer: List[int] = []
+_retries: List[Tuple[List[int], int]] = []  # (order IDs, retries made) per failed batch
+_buffer_ready: Optional[asyncio.Event] = None
+_flusher: Optional[asyncio.Task] = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the worker event loop, starting its thread on first use.
+    
+    Returns:
+        asyncio.AbstractEventLoop: Loop running in the worker thread
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever,
+                name='telegram-notifications',
+                daemon=True
+            )
+            thread.start()
+            _loop = loop
+        return _loop
+
+
+def run(coro, timeout: Optional[float] = None):
+    """
+    Run a coroutine on the worker loop and wait for its result (sync callers only).
+    
+    Args:
+        coro: Coroutine to run
+        timeout: Seconds to wait for the result (None waits forever)
+        
+    Returns:
+        The coroutine's result
+        
+    Raises:
+        RuntimeError: If called from a running event loop (it would block it)
+    """
+    if asyncio._get_running_loop() is not None:
+        coro.close()
+        raise RuntimeError('worker.run() cannot be called from a running event loop')
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+def spawn(coro) -> None:
+    """
+    Start a coroutine on the worker loop without waiting for it.
+    
+    Exceptions it raises are logged.
+    
+    Args:
+        coro: Coroutine to run
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    future.add_done_callback(_log_failure)
+
+
+def _log_failure(future) -> None:
+    """Log the exception of a finished spawn()ed coroutine, if any."""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f'Background task failed: {future.exception()!r}')
+
+
+def submit(order_id: int) -> bool:
+    """
+    Queue a notification for a new order (non-blocking).
+    
+    Args:
+        order_id: Order ID to send notification for
+        
+    Returns:
+        bool: True if queued, False if dropped because the worker is saturated
+    """
+    global _pending_count
+    loop = get_loop()
+    
+    with _lock:
+        if _pending_count >= MAX_PENDING_NOTIFICATIONS:
+            logger.error(
+                f'Notification queue full ({MAX_PENDING_NOTIFICATIONS}), '
+                f'dropping notification for order #{order_id}'
+            )
+            return False
+        _pending_count += 1
+    
+    loop.call_soon_threadsafe(_enqueue, order_id)
+    return True
+
+
+def _enqueue(order_id: int) -> None:
+    """Buffer an order ID and make sure the flusher is running (loop thread)."""
+    _wake_flusher()
+    _buffer.append(order_id)
+    _buffer_ready.set()
+
+
+def _enqueue_retry(order_ids: List[int], attempt: int) -> None:
+    """Queue a failed batch to be sent again as is (loop thread)."""
+    _wake_flusher()
+    _retries.append((order_ids, attempt))
+    _buffer_ready.set()
+
+
+def _wake_flusher() -> None:
+    """Create the buffer event and start the flusher if needed (loop thread)."""
+    global _buffer_ready, _flusher
+    if _buffer_ready is None:
+        _buffer_ready = asyncio.Event()
+    if _flusher is None or _flusher.done():
+        _flusher = asyncio.get_running_loop().create_task(_flush_loop())
+
+
+def _done(count: int) -> None:
+    """Mark count buffered orders as handled."""
+    global _pending_count
+    with _lock:
+        _pending_count -= count
+        if _pending_count == 0:
+            _idle.notify_all()
+
+
+async def _flush_loop() -> None:
+    """
+    Send buffered orders, one message per GROUP_MESSAGE_INTERVAL.
+    
+    A lone order is sent right away; orders arriving while the interval
+    runs out are sent together in the next message. Batches being retried
+    go first and are never merged with new orders, so each keeps its own
+    retry count.
+    """
+    loop = asyncio.get_running_loop()
+    next_send_at = 0.0
+    
+    while True:
+        await _buffer_ready.wait()
+        
+        delay = next_send_at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        
+        if _retries:
+            batch, attempt = _retries.pop(0)
+        else:
+            batch, attempt = _buffer[:COALESCE_MAX_ORDERS], 0
+            del _buffer[:len(batch)]
+        if not _buffer and not _retries:
+            _buffer_ready.clear()
+        
+        next_send_at = loop.time() + GROUP_MESSAGE_INTERVAL
+        try:
+            await _send_notifications(batch, attempt)
+        finally:
+            _done(len(batch))
+
+
+def _retry_later(order_ids: List[int], attempt: int, error: NotificationFailedError) -> bool:
+    """
+    Queue a batch again after a backoff delay if the failure is transient.
+    
+    Args:
+        order_ids: Order IDs whose notification failed (one batch)
+        attempt: Number of retries already made for the batch
+        error: The send failure
+        
+    Returns:
+        bool: True if a retry was scheduled
+    """
+    global _pending_count
+    cause = error.__cause__
+    # BadRequest subclasses NetworkError but retrying it won't help
+    transient = isinstance(cause, RetryAfter) or (
+        isinstance(cause, NetworkError) and not isinstance(cause, BadRequest)
+    )
+    if not transient or attempt >= NOTIFICATION_MAX_RETRIES:
+        return False
+    
+    delay = RETRY_BACKOFF * 2 ** attempt
+    if isinstance(cause, RetryAfter):
+        delay = max(delay, cause.retry_after)
+    
+    with _lock:
+        _pending_count += len(order_ids)
+    
+    logger.warning(
+        f'Retrying notification for orders {order_ids} in {delay}s '
+        f'(attempt {attempt + 1}/{NOTIFICATION_MAX_RETRIES})'
+    )
+    asyncio.get_running_loop().call_later(delay, _enqueue_retry, order_ids, attempt + 1)
+    return True
+
+
+async def _send_notifications(order_ids: List[int], attempt: int = 0) -> None:
+    """
+    Load the orders and send their notification, logging (never raising) failures.
+    
+    Args:
+        order_ids: Order IDs to notify about (one message for all of them)
+        attempt: Number of retries already made for this batch
+    """
+    from telegram_bot.services import NotificationService
+    
+    try:
+        # Everything the message needs in two queries (orders + promo, items)
+        queryset = NotificationService.get_orders(order_ids).order_by('id')
+        orders = [order async for order in queryset]
+        
+        missing = set(order_ids).difference(order.id for order in orders)
+        if missing:
+            logger.error(f'Orders not found: {sorted(missing)}')
+        
+        if not orders:
+            return
+        
+        logger.info(f'Sending notification for orders {[order.id for order in orders]}...')
+        
+        # Failures are recorded below, once no retry is left
+        if len(orders) == 1:
+            notification = await NotificationService.send_order_notification(
+                orders[0], record_failure=False
+            )
+        else:
+            notification = (await NotificationService.send_orders_notification(
+                orders, record_failure=False
+            ))[0]
+        logger.info(f'Notification sent successfully: {notification.message_id}')
+        
+    except (BotNotConfiguredError, BotInactiveError) as e:
+        # Bot is not configured or inactive - log and skip
+        logger.warning(f'Bot not configured or inactive, skipping notification: {e}')
+        
+    except NotificationFailedError as e:
+        # Network error or flood control - try again later; otherwise record
+        # the failure and give up
+        if not _retry_later(order_ids, attempt, e):
+            logger.error(f'Failed to send notification for orders {order_ids}: {e}')
+            try:
+                await NotificationService.save_failed_notifications(orders, str(e))
+            except Exception as save_error:
+                logger.exception(f'Could not record failed notification for orders {order_ids}: {save_error}')
+        
+    except Exception as e:
+        # Unexpected error - log but don't raise
+        logger.exception(f'Unexpected error sending notification for orders {order_ids}: {e}')
+        
+    finally:
+        # The worker thread lives forever; don't keep stale DB connections around
+        await sync_to_async(close_old_connections)()
+
+
+def close_all() -> None:
+    """
+    Release Telegram resources before the process exits (atexit hook).
+    
+    Lets queued notifications go out (for up to SHUTDOWN_TIMEOUT seconds),
+    closes the cached Bot and /health HTTP connection pools, then stops
+    the worker loop.
+    """
+    from telegram_bot.services.telegram import TelegramService
+    from telegram_bot.services.webhook import close_http_client
+    
+    with _idle:
+        if _pending_count:
+            logger.info(f'Waiting for {_pending_count} pending notification(s)...')
+            if not _idle.wait_for(lambda: _pending_count == 0, timeout=SHUTDOWN_TIMEOUT):
+                logger.warning(f'Exiting with {_pending_count} notification(s) not sent')
+    
+    # Pools are closed on their own loops, so the worker loop must still run
+    TelegramService.close_bots()
+    close_http_client()
+    
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_loop.stop)